@@ -1,5 +1,6 @@
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -22,26 +23,29 @@ async def approve_all_pending_users():
         pending_users = await db.users.find({"status": "pending"}).to_list(1000)
         
         print(f"Found {len(pending_users)} pending users")
+        if not pending_users:
+            return
         
-        for user in pending_users:
-            # Approve the user
-            result = await db.users.update_one(
-                {"id": user["id"]},
+        # One unordered bulk write for the whole intake instead of an update per user
+        approved_at = datetime.now(timezone.utc)
+        result = await db.users.bulk_write([
+            UpdateOne(
+                {"id": user["id"], "status": "pending"},
                 {
                     "$set": {
                         "status": "approved",
-                        "approved_at": datetime.now(timezone.utc),
+                        "approved_at": approved_at,
                         "approved_by": "system_test"
                     }
                 }
             )
-            
-            if result.modified_count > 0:
-                print(f"✅ Approved: {user['full_name']} ({user['email']})")
-            else:
-                print(f"❌ Failed to approve: {user['full_name']} ({user['email']})")
+            for user in pending_users
+        ], ordered=False)
+        
+        for user in pending_users:
+            print(f"✅ Approved: {user['full_name']} ({user['email']})")
         
-        print(f"\n🎉 Approved {len(pending_users)} users for testing")
+        print(f"\n🎉 Approved {result.modified_count} users for testing")
         
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,236 @@
+"""Response compression for the backend.
+
+CompressionMiddleware negotiates brotli or gzip from Accept-Encoding and
+compresses text and JSON responses of at least ``minimum_size`` bytes.
+Anything outside the content-type allowlist (PDFs in particular, which
+are already compressed and served with byte ranges) passes through
+untouched, as do partial and bodiless responses.
+
+Responses of the routes in ``cached_routes`` are compressed once per
+distinct body: the compressed bytes are kept in a bounded LRU keyed by a
+digest of the uncompressed body, so repeated listings skip the compressor.
+"""
+import gzip
+import hashlib
+import zlib
+from collections import OrderedDict
+
+import brotli
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/",
+)
+# Never compressed, even if a broader allowlist would match them
+INCOMPRESSIBLE_TYPES = ("application/pdf",)
+
+
+def parse_accept_encoding(header: str) -> dict:
+    """Map each coding in an Accept-Encoding header to its q-value"""
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding.strip().lower()] = q
+    return codings
+
+
+def choose_encoding(header: str):
+    """Pick br or gzip for the request, preferring br when both are acceptable"""
+    codings = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for encoding in ("br", "gzip"):
+        q = codings.get(encoding, codings.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";")[0].strip().lower()
+    if media_type in INCOMPRESSIBLE_TYPES:
+        return False
+    return any(media_type == allowed or (allowed.endswith("/") and media_type.startswith(allowed))
+               for allowed in COMPRESSIBLE_TYPES)
+
+
+class CompressedBodyCache:
+    """LRU of compressed bodies bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, key, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self._entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str, level: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+            self._finish = self._compressor.finish
+            self._process = self._compressor.process
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+            self._finish = self._compressor.flush
+            self._process = self._compressor.compress
+
+    def compress(self, data: bytes) -> bytes:
+        return self._process(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def compress(body: bytes, encoding: str, level: int) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=level)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing eligible responses with brotli or gzip"""
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5,
+                 cached_routes=(), cache_max_bytes: int = 32 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+        self.cached_routes = frozenset(cached_routes)
+        self.cache = CompressedBodyCache(cache_max_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = choose_encoding(accept_encoding)
+
+        start_message = None
+        headers = None
+        buffered = []
+        buffered_size = 0
+        compressor = None
+        passthrough = False
+
+        async def send_start(compressed: bool, body_length=None):
+            if compressed:
+                headers.pop("content-length", None)
+                headers["content-encoding"] = encoding
+                if body_length is not None:
+                    headers["content-length"] = str(body_length)
+                etag = headers.get("etag")
+                if etag and not etag.startswith("W/"):
+                    # The compressed representation is not byte-identical to the original
+                    headers["etag"] = f"W/{etag}"
+            start_message["headers"] = [(name.encode("latin-1"), value.encode("latin-1"))
+                                        for name, value in headers.items()]
+            await send(start_message)
+
+        async def send_wrapper(message):
+            nonlocal start_message, headers, buffered_size, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = {name.decode("latin-1").lower(): value.decode("latin-1")
+                           for name, value in message.get("headers", [])}
+                content_type = headers.get("content-type", "")
+                if (not is_compressible(content_type) or message["status"] in (204, 206, 304)
+                        or "content-encoding" in headers or "content-range" in headers):
+                    passthrough = True
+                    await send(message)
+                    return
+                # The body depends on Accept-Encoding even when this client gets it uncompressed
+                vary = headers.get("vary")
+                if not vary:
+                    headers["vary"] = "Accept-Encoding"
+                elif "accept-encoding" not in vary.lower():
+                    headers["vary"] = f"{vary}, Accept-Encoding"
+                if encoding is None:
+                    passthrough = True
+                    await send_start(False)
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if compressor is not None:
+                chunk = compressor.compress(body)
+                if not more_body:
+                    chunk += compressor.finish()
+                if chunk or not more_body:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+                return
+
+            buffered.append(body)
+            buffered_size += len(body)
+            if more_body and buffered_size < self.minimum_size:
+                return
+
+            payload = b"".join(buffered)
+            buffered.clear()
+            if not more_body:
+                # Whole body in hand: send it as is when small, otherwise compress it in one go
+                if buffered_size < self.minimum_size:
+                    await send_start(False)
+                    await send({"type": "http.response.body", "body": payload})
+                    return
+                await self._send_compressed(scope, encoding, payload, send_start, send)
+                return
+
+            # A long streamed body: compress it as it goes
+            compressor = _StreamCompressor(encoding, self.levels[encoding])
+            await send_start(True)
+            await send({"type": "http.response.body", "body": compressor.compress(payload), "more_body": True})
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_compressed(self, scope, encoding, payload, send_start, send):
+        route = getattr(scope.get("route"), "path", None)
+        cache_key = None
+        compressed = None
+        if route in self.cached_routes:
+            cache_key = (encoding, hashlib.blake2b(payload, digest_size=16).digest())
+            compressed = self.cache.get(cache_key)
+        if compressed is None:
+            compressed = compress(payload, encoding, self.levels[encoding])
+            if cache_key is not None:
+                self.cache.put(cache_key, compressed)
+        await send_start(True, len(compressed))
+        await send({"type": "http.response.body", "body": compressed})
@@ -0,0 +1,179 @@
+"""Declared MongoDB indexes for the backend.
+
+The app applies INDEX_SPECS on startup. The same specs can be checked
+against a live database from the command line:
+
+    python backend/indexes.py diff     # exit status 1 when they differ
+    python backend/indexes.py apply
+"""
+import asyncio
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Options that make two indexes on the same keys behave differently
+COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    options: Dict = field(default_factory=dict, hash=False)
+
+    @property
+    def name(self) -> str:
+        # Same naming scheme as pymongo, so specs line up with existing indexes
+        return "_".join(f"{key}_{direction}" for key, direction in self.keys)
+
+
+INDEX_SPECS: List[IndexSpec] = [
+    # Login, registration and principal lookups
+    IndexSpec("users", (("email", 1),), {"unique": True}),
+    IndexSpec("users", (("id", 1),), {"unique": True}),
+    # /users-with-works filters approved users by level and orders by created_at
+    IndexSpec("users", (("status", 1), ("level", 1), ("created_at", 1))),
+    # Keyset pages of pending users and of all users
+    IndexSpec("users", (("status", 1), ("created_at", 1), ("id", 1))),
+    IndexSpec("users", (("created_at", 1), ("id", 1))),
+
+    IndexSpec("work_files", (("id", 1),), {"unique": True}),
+    # Works by level, keyset-paginated on (uploaded_at, id)
+    IndexSpec("work_files", (("level", 1), ("uploaded_at", 1), ("id", 1))),
+    IndexSpec("work_files", (("uploaded_at", 1), ("id", 1))),
+    # $lookup of a member's works
+    IndexSpec("work_files", (("uploaded_by", 1), ("uploaded_at", 1))),
+    # Upload preflight: is this content already in a work the member may read
+    IndexSpec("work_files", (("sha256", 1), ("level", 1))),
+
+    # Reset tokens are looked up by hash, coalesced per email and reaped by Mongo once expired
+    IndexSpec("password_reset_tokens", (("token_hash", 1),), {"unique": True, "sparse": True}),
+    IndexSpec("password_reset_tokens", (("email", 1), ("used", 1), ("expires_at", 1))),
+    IndexSpec("password_reset_tokens", (("expires_at", 1),), {"expireAfterSeconds": 0}),
+
+    IndexSpec("blobs", (("sha256", 1),), {"unique": True}),
+
+    # Refresh tokens are looked up by hash, revoked per member or per session, and reaped once expired
+    IndexSpec("refresh_tokens", (("token_hash", 1),), {"unique": True}),
+    IndexSpec("refresh_tokens", (("user_id", 1),)),
+    IndexSpec("refresh_tokens", (("email", 1),)),
+    IndexSpec("refresh_tokens", (("family_id", 1),)),
+    IndexSpec("refresh_tokens", (("expires_at", 1),), {"expireAfterSeconds": 0}),
+
+    # Jobs are claimed by priority then due time, requeued when their lease lapses and reaped once finished
+    IndexSpec("jobs", (("id", 1),), {"unique": True}),
+    IndexSpec("jobs", (("status", 1), ("priority", -1), ("run_at", 1))),
+    IndexSpec("jobs", (("status", 1), ("lease_until", 1))),
+    IndexSpec("jobs", (("expires_at", 1),), {"expireAfterSeconds": 0}),
+
+    # Outbox messages are claimed when due, a digest takes its whole kind, and sent ones are reaped
+    IndexSpec("outbox", (("id", 1),), {"unique": True}),
+    IndexSpec("outbox", (("status", 1), ("send_after", 1))),
+    IndexSpec("outbox", (("status", 1), ("kind", 1))),
+    IndexSpec("outbox", (("batch", 1),)),
+    IndexSpec("outbox", (("status", 1), ("lease_until", 1))),
+    IndexSpec("outbox", (("expires_at", 1),), {"expireAfterSeconds": 0}),
+
+    # Login throttle counters, one per key and window, shared between workers and expired with their window
+    IndexSpec("login_throttle_buckets", (("key", 1), ("window", 1)), {"unique": True}),
+    IndexSpec("login_throttle_buckets", (("expires_at", 1),), {"expireAfterSeconds": 0}),
+]
+
+
+def _options_of(index_info: dict) -> dict:
+    return {option: index_info[option] for option in COMPARED_OPTIONS if option in index_info}
+
+
+async def diff_indexes(db, specs: List[IndexSpec] = INDEX_SPECS) -> dict:
+    """Compare declared specs with the indexes that exist in db.
+
+    Returns {"missing": [...], "mismatched": [...], "unexpected": [...]}
+    where missing and mismatched hold IndexSpec objects and unexpected holds
+    (collection, index name) pairs.
+    """
+    missing, mismatched, unexpected = [], [], []
+    by_collection: Dict[str, List[IndexSpec]] = {}
+    for spec in specs:
+        by_collection.setdefault(spec.collection, []).append(spec)
+
+    for collection, collection_specs in by_collection.items():
+        existing = await db[collection].index_information()
+        existing_by_keys = {tuple((key, int(direction)) for key, direction in info["key"]): (name, info)
+                            for name, info in existing.items()}
+        declared_keys = set()
+        for spec in collection_specs:
+            declared_keys.add(spec.keys)
+            if spec.keys not in existing_by_keys:
+                missing.append(spec)
+            elif _options_of(existing_by_keys[spec.keys][1]) != spec.options:
+                mismatched.append(spec)
+        for keys, (name, _) in existing_by_keys.items():
+            if name != "_id_" and keys not in declared_keys:
+                unexpected.append((collection, name))
+
+    return {"missing": missing, "mismatched": mismatched, "unexpected": unexpected}
+
+
+async def apply_indexes(db, specs: List[IndexSpec] = INDEX_SPECS) -> List[IndexSpec]:
+    """Create every declared index that is not there yet.
+
+    Safe to run repeatedly. An index that cannot be built (duplicate keys,
+    conflicting options) is logged and skipped so the others still get
+    built; the failed specs are returned.
+    """
+    failed = []
+    for spec in specs:
+        try:
+            await db[spec.collection].create_index(list(spec.keys), background=True, **spec.options)
+        except OperationFailure as e:
+            logger.error(f"Could not build index {spec.collection}.{spec.name}: {e}")
+            failed.append(spec)
+    return failed
+
+
+def _describe(spec: IndexSpec) -> str:
+    options = f" {spec.options}" if spec.options else ""
+    return f"{spec.collection}.{spec.name}{options}"
+
+
+async def _main(command: str) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if command == "apply":
+            failed = await apply_indexes(db)
+            for spec in failed:
+                print(f"failed: {_describe(spec)}")
+            return 1 if failed else 0
+
+        differences = await diff_indexes(db)
+        for spec in differences["missing"]:
+            print(f"missing:    {_describe(spec)}")
+        for spec in differences["mismatched"]:
+            print(f"mismatched: {_describe(spec)}")
+        for collection, name in differences["unexpected"]:
+            print(f"unexpected: {collection}.{name}")
+        if not any(differences.values()):
+            print("Indexes match the declared spec")
+            return 0
+        return 1
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("diff", "apply"):
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
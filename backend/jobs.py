@@ -0,0 +1,265 @@
+"""Durable background jobs stored in MongoDB.
+
+A job is a document in the ``jobs`` collection:
+
+    id, kind, payload, priority     what to run; higher priority runs first
+    status                          queued, running, done or failed
+    run_at                          not claimed before this time (retry backoff)
+    attempts, max_attempts          failed attempts are retried until max_attempts
+    worker, lease_until             who holds a running job, and until when
+
+Workers claim jobs atomically with find_one_and_update and keep extending
+their lease while a handler runs. A job whose lease lapses (its worker
+died) is queued again, so handlers must be idempotent: a job runs at least
+once. Finished jobs are kept for JOB_RETENTION and then removed by a TTL
+index on expires_at.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from pymongo import ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+JOB_RETENTION = timedelta(days=7)
+BACKOFF_BASE_SECONDS = 2.0
+BACKOFF_MAX_SECONDS = 3600.0
+
+Handler = Callable[[dict], Awaitable[None]]
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, so retries of a burst don't fire together"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def new_job(kind: str, payload: dict, priority: int = 0, delay_seconds: float = 0, max_attempts: int = 5) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "payload": payload,
+        "priority": priority,
+        "status": "queued",
+        "run_at": now + timedelta(seconds=delay_seconds),
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "worker": None,
+        "lease_until": None,
+        "created_at": now,
+        "last_error": None,
+    }
+
+
+class JobQueue:
+    def __init__(self, db, lease_seconds: float = 60):
+        self.collection = db.jobs
+        self.lease_seconds = lease_seconds
+        # Set on enqueue so workers in this process don't wait out their poll interval
+        self.wakeup = asyncio.Event()
+
+    async def enqueue(self, kind: str, payload: dict, priority: int = 0, delay_seconds: float = 0,
+                      max_attempts: int = 5) -> str:
+        job = new_job(kind, payload, priority, delay_seconds, max_attempts)
+        await self.collection.insert_one(job)
+        self.wakeup.set()
+        return job["id"]
+
+    async def enqueue_many(self, jobs: List[dict]) -> List[str]:
+        """Insert jobs built with new_job in one round trip"""
+        if jobs:
+            await self.collection.insert_many(jobs, ordered=False)
+            self.wakeup.set()
+        return [job["id"] for job in jobs]
+
+    async def claim(self, worker_id: str, kinds: Optional[Iterable[str]] = None) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        query = {"status": "queued", "run_at": {"$lte": now}}
+        if kinds is not None:
+            query["kind"] = {"$in": list(kinds)}
+        return await self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker_id,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                    "started_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", -1), ("run_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def heartbeat(self, job: dict) -> bool:
+        """Extend the lease; False when the job was taken away from this worker"""
+        result = await self.collection.update_one(
+            {"id": job["id"], "worker": job["worker"], "status": "running"},
+            {"$set": {"lease_until": datetime.now(timezone.utc) + timedelta(seconds=self.lease_seconds)}},
+        )
+        return result.matched_count == 1
+
+    async def complete(self, job: dict):
+        now = datetime.now(timezone.utc)
+        await self.collection.update_one(
+            {"id": job["id"], "worker": job["worker"], "status": "running"},
+            {"$set": {"status": "done", "finished_at": now, "lease_until": None, "expires_at": now + JOB_RETENTION}},
+        )
+
+    async def fail(self, job: dict, error: str):
+        """Queue the job again after a backoff, or give up once it is out of attempts"""
+        now = datetime.now(timezone.utc)
+        if job["attempts"] < job["max_attempts"]:
+            update = {
+                "status": "queued",
+                "run_at": now + timedelta(seconds=backoff_delay(job["attempts"])),
+                "worker": None,
+                "lease_until": None,
+                "last_error": error,
+            }
+        else:
+            update = {
+                "status": "failed",
+                "finished_at": now,
+                "lease_until": None,
+                "last_error": error,
+                "expires_at": now + JOB_RETENTION,
+            }
+        await self.collection.update_one(
+            {"id": job["id"], "worker": job["worker"], "status": "running"}, {"$set": update}
+        )
+
+    async def requeue_expired(self) -> int:
+        """Put running jobs whose worker stopped renewing the lease back in the queue.
+
+        A job out of attempts fails instead, so one that crashes or hangs
+        its worker every time is not retried forever.
+        """
+        now = datetime.now(timezone.utc)
+        expired = await self.collection.find(
+            {"status": "running", "lease_until": {"$lt": now}}, {"_id": 0, "id": 1, "attempts": 1, "max_attempts": 1}
+        ).to_list(None)
+        exhausted = [job["id"] for job in expired if job["attempts"] >= job["max_attempts"]]
+        retry = [job["id"] for job in expired if job["attempts"] < job["max_attempts"]]
+        if exhausted:
+            await self.collection.update_many(
+                {"id": {"$in": exhausted}, "status": "running", "lease_until": {"$lt": now}},
+                {"$set": {"status": "failed", "finished_at": now, "worker": None, "lease_until": None,
+                          "last_error": "lease expired", "expires_at": now + JOB_RETENTION}},
+            )
+        if not retry:
+            return 0
+        result = await self.collection.update_many(
+            {"id": {"$in": retry}, "status": "running", "lease_until": {"$lt": now}},
+            {"$set": {"status": "queued", "worker": None, "lease_until": None,
+                      "last_error": "lease expired"}},
+        )
+        if result.modified_count:
+            self.wakeup.set()
+        return result.modified_count
+
+
+class JobWorkerPool:
+    """Runs queued jobs with ``concurrency`` asyncio workers until stopped"""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, Handler], concurrency: int = 4,
+                 poll_interval: float = 1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        self._stopping.clear()
+        self._tasks = [asyncio.create_task(self._work(f"{self.worker_prefix}:{i}")) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._reap()))
+
+    async def stop(self, timeout: float = 10.0):
+        """Let running handlers finish for up to timeout seconds, then cancel them"""
+        self._stopping.set()
+        self.queue.wakeup.set()
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    async def _idle(self, seconds: float):
+        try:
+            await asyncio.wait_for(self.queue.wakeup.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _work(self, worker_id: str):
+        while not self._stopping.is_set():
+            try:
+                job = await self.queue.claim(worker_id, self.handlers.keys())
+            except Exception as e:
+                logger.warning(f"Job claim failed: {e}")
+                await self._idle(self.poll_interval)
+                continue
+            if job is None:
+                self.queue.wakeup.clear()
+                await self._idle(self.poll_interval)
+                continue
+            await self._run(job)
+
+    async def _run(self, job: dict):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            await self.handlers[job["kind"]](job["payload"])
+        except asyncio.CancelledError:
+            # Shutting down mid-job: the lease lapses and another worker picks it up
+            raise
+        except Exception as e:
+            logger.warning(f"Job {job['kind']} {job['id']} failed (attempt {job['attempts']}): {e}")
+            await self._record(self.queue.fail(job, "".join(traceback.format_exception_only(type(e), e)).strip()), job)
+        else:
+            await self._record(self.queue.complete(job), job)
+        finally:
+            heartbeat.cancel()
+
+    async def _record(self, outcome: Awaitable[None], job: dict):
+        # Keep the worker alive; the lease lapses and the job is requeued or failed later
+        try:
+            await outcome
+        except Exception as e:
+            logger.warning(f"Recording the outcome of job {job['kind']} {job['id']} failed: {e}")
+
+    async def _heartbeat(self, job: dict):
+        while True:
+            await asyncio.sleep(self.queue.lease_seconds / 3)
+            try:
+                renewed = await self.queue.heartbeat(job)
+            except Exception as e:
+                # Try again next beat; the lease has two more beats of slack
+                logger.warning(f"Heartbeat for job {job['kind']} {job['id']} failed: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Lost the lease on job {job['kind']} {job['id']}")
+                return
+
+    async def _reap(self):
+        while not self._stopping.is_set():
+            try:
+                await self.queue.requeue_expired()
+            except Exception as e:
+                logger.warning(f"Requeueing expired jobs failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.queue.lease_seconds / 2)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,130 @@
+"""Prometheus metrics for the backend.
+
+Covers per-route request counts, latencies and response sizes (labelled
+with the route template, e.g. /api/works/{level}), MongoDB command
+timings per collection and command, event-loop lag and the password hash
+pool. server.py exposes the registry on /metrics.
+
+Each uvicorn worker process keeps its own registry.
+"""
+import asyncio
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+registry = CollectorRegistry()
+
+REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests by route template and status code",
+    ["method", "route", "status"],
+    registry=registry,
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last body byte",
+    ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    registry=registry,
+)
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes",
+    "Response body size",
+    ["method", "route"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864),
+    registry=registry,
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command round trips as reported by the driver",
+    ["collection", "command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+    registry=registry,
+)
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "How late the event loop wakes up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+    registry=registry,
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "password_hash_queue_depth",
+    "Password hash operations waiting for a pool worker",
+    registry=registry,
+)
+PASSWORD_HASH_IN_FLIGHT = Gauge(
+    "password_hash_in_flight",
+    "Password hash operations queued or running",
+    registry=registry,
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording count, latency and size per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_code = 500
+        body_size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, body_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                body_size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            route_template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUESTS.labels(method, route_template, str(status_code)).inc()
+            REQUEST_LATENCY.labels(method, route_template).observe(time.perf_counter() - started)
+            RESPONSE_SIZE.labels(method, route_template).observe(body_size)
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """pymongo listener timing every command per collection"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        collection = target if isinstance(target, str) else ""
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event, outcome):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name, outcome).observe(event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """Sample how far past its deadline a sleep resumes, until cancelled"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+
+def render_metrics():
+    return generate_latest(registry), CONTENT_TYPE_LATEST
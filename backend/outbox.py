@@ -0,0 +1,300 @@
+"""Outgoing email, queued in MongoDB and sent in batches.
+
+Request handlers only append messages to the ``outbox`` collection.
+OutboxSender drains it in the background: it claims the messages that are
+due, renders them (all queued messages of a digest kind become a single
+email, sent as soon as the first of them is due) and sends the result over one SMTP connection that stays open
+between batches. Messages are claimed with a lease, so several processes
+may run a sender. Failed messages are retried with backoff.
+
+A message is sent at least once; a process dying mid-batch can repeat it.
+"""
+import asyncio
+import logging
+import smtplib
+import ssl
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from jobs import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+SENT_RETENTION = timedelta(days=7)
+MAX_ATTEMPTS = 5
+
+# Turns claimed messages of one kind into emails, each with the ids of the messages it covers
+Renderer = Callable[[List[dict]], Awaitable[List[Tuple[EmailMessage, List[str]]]]]
+
+
+class Outbox:
+    def __init__(self, db, digest_kinds: Iterable[str] = (), lease_seconds: float = 120):
+        self.collection = db.outbox
+        self.digest_kinds = set(digest_kinds)
+        self.lease_seconds = lease_seconds
+        self.wakeup = asyncio.Event()
+
+    async def append(self, kind: str, payload: dict, delay_seconds: float = 0) -> str:
+        now = datetime.now(timezone.utc)
+        message = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "payload": payload,
+            "status": "pending",
+            "created_at": now,
+            "send_after": now + timedelta(seconds=delay_seconds),
+            "attempts": 0,
+            "last_error": None,
+        }
+        await self.collection.insert_one(message)
+        self.wakeup.set()
+        return message["id"]
+
+    async def claim(self, limit: int) -> List[dict]:
+        """Lease up to `limit` due messages, plus every queued message of a digest kind that has one due"""
+        now = datetime.now(timezone.utc)
+        due = await self.collection.find(
+            {"status": "pending", "send_after": {"$lte": now}}, {"_id": 0, "id": 1, "kind": 1}
+        ).sort("send_after", 1).limit(limit).to_list(limit)
+        if not due:
+            return []
+        # A digest takes everything queued for it so far, due or not. Other
+        # kinds wait for their own send_after, which also holds their retry backoff
+        ids = [message["id"] for message in due]
+        digests = {message["kind"] for message in due if message["kind"] in self.digest_kinds}
+        if digests:
+            pending = await self.collection.find(
+                {"status": "pending", "kind": {"$in": list(digests)}, "id": {"$nin": ids}}, {"_id": 0, "id": 1}
+            ).limit(limit).to_list(limit)
+            ids.extend(message["id"] for message in pending)
+
+        batch = uuid.uuid4().hex
+        await self.collection.update_many(
+            {"id": {"$in": ids}, "status": "pending"},
+            {
+                "$set": {"status": "sending", "batch": batch, "lease_until": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1},
+            },
+        )
+        return await self.collection.find({"batch": batch, "status": "sending"}, {"_id": 0}).to_list(None)
+
+    async def mark_sent(self, ids: List[str], status: str = "sent"):
+        if not ids:
+            return
+        now = datetime.now(timezone.utc)
+        await self.collection.update_many(
+            {"id": {"$in": ids}},
+            {"$set": {"status": status, "sent_at": now, "lease_until": None, "expires_at": now + SENT_RETENTION}},
+        )
+
+    async def mark_failed(self, messages: List[dict], error: str):
+        now = datetime.now(timezone.utc)
+        for message in messages:
+            if message["attempts"] < MAX_ATTEMPTS:
+                update = {"status": "pending", "send_after": now + timedelta(seconds=backoff_delay(message["attempts"]))}
+            else:
+                update = {"status": "failed", "expires_at": now + SENT_RETENTION}
+            await self.collection.update_one(
+                {"id": message["id"]}, {"$set": {**update, "lease_until": None, "last_error": error}}
+            )
+
+    async def requeue_expired(self) -> int:
+        result = await self.collection.update_many(
+            {"status": "sending", "lease_until": {"$lt": datetime.now(timezone.utc)}},
+            {"$set": {"status": "pending", "lease_until": None, "last_error": "lease expired"}},
+        )
+        return result.modified_count
+
+
+class LogTransport:
+    """Stands in for SMTP when none is configured: logs each email instead"""
+
+    async def send(self, emails: List[EmailMessage]) -> List[Optional[str]]:
+        for email in emails:
+            logger.info(f"Email to {email['To']}: {email['Subject']}\n{email.get_content()}")
+        return [None] * len(emails)
+
+    async def close_if_idle(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class SmtpTransport:
+    """One SMTP connection, reused across batches and closed after idle_seconds without mail.
+
+    smtplib blocks, so the connection lives in a dedicated thread.
+    """
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = True, use_ssl: bool = False, timeout: float = 10, idle_seconds: float = 60):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.use_ssl = use_ssl
+        self.timeout = timeout
+        self.idle_seconds = idle_seconds
+        self.connections_opened = 0
+        self._connection: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="smtp")
+
+    def _connect(self) -> smtplib.SMTP:
+        if self._connection is None:
+            if self.use_ssl:
+                connection = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout,
+                                              context=ssl.create_default_context())
+            else:
+                connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+                if self.starttls:
+                    connection.starttls(context=ssl.create_default_context())
+            if self.username:
+                connection.login(self.username, self.password or "")
+            self._connection = connection
+            self.connections_opened += 1
+        return self._connection
+
+    def _send_one(self, email: EmailMessage):
+        try:
+            self._connect().send_message(email)
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped the idle connection; reconnect once
+            self._connection = None
+            self._connect().send_message(email)
+
+    def _send_batch(self, emails: List[EmailMessage]) -> List[Optional[str]]:
+        errors = []
+        unreachable = None
+        for email in emails:
+            if unreachable:
+                errors.append(unreachable)
+                continue
+            try:
+                self._send_one(email)
+                errors.append(None)
+            except smtplib.SMTPRecipientsRefused as e:
+                errors.append(f"recipients refused: {e.recipients}")
+            except (smtplib.SMTPException, OSError) as e:
+                error = str(e) or type(e).__name__
+                errors.append(error)
+                if not isinstance(e, smtplib.SMTPResponseException):
+                    # A socket error leaves the connection unusable
+                    self._close()
+                if self._connection is None:
+                    # Connecting failed; don't wait out the timeout again for every remaining email
+                    unreachable = error
+        self._last_used = time.monotonic()
+        return errors
+
+    def _close(self):
+        if self._connection is not None:
+            try:
+                self._connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._connection = None
+
+    def _close_if_idle(self):
+        if self._connection is not None and time.monotonic() - self._last_used > self.idle_seconds:
+            self._close()
+
+    async def send(self, emails: List[EmailMessage]) -> List[Optional[str]]:
+        """Send emails in order; returns an error string or None for each"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._send_batch, emails)
+
+    async def close_if_idle(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close_if_idle)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+
+
+class OutboxSender:
+    """Drains the outbox with the given renderers until stopped"""
+
+    def __init__(self, outbox: Outbox, transport, renderers: Dict[str, Renderer],
+                 batch_size: int = 100, poll_interval: float = 5.0):
+        self.outbox = outbox
+        self.transport = transport
+        self.renderers = renderers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        self._stopping.set()
+        self.outbox.wakeup.set()
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self._task, timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._task = None
+        await self.transport.close()
+
+    async def drain_once(self) -> int:
+        """Send one batch of due messages; returns how many messages were claimed"""
+        await self.outbox.requeue_expired()
+        messages = await self.outbox.claim(self.batch_size)
+        by_kind: Dict[str, List[dict]] = {}
+        for message in messages:
+            by_kind.setdefault(message["kind"], []).append(message)
+
+        for kind, kind_messages in by_kind.items():
+            renderer = self.renderers.get(kind)
+            try:
+                if renderer is None:
+                    raise ValueError(f"no renderer for outbox kind {kind}")
+                rendered = await renderer(kind_messages)
+            except Exception as e:
+                logger.warning(f"Could not render {len(kind_messages)} {kind} messages: {e}")
+                await self.outbox.mark_failed(kind_messages, str(e))
+                continue
+
+            errors = await self.transport.send([email for email, _ in rendered]) if rendered else []
+            messages_by_id = {message["id"]: message for message in kind_messages}
+            sent, failed = [], {}
+            for (_, ids), error in zip(rendered, errors):
+                if error is None:
+                    sent.extend(ids)
+                else:
+                    failed.setdefault(error, []).extend(messages_by_id[i] for i in ids)
+            await self.outbox.mark_sent(sent)
+            for error, failed_messages in failed.items():
+                logger.warning(f"Could not send {len(failed_messages)} {kind} messages: {error}")
+                await self.outbox.mark_failed(failed_messages, error)
+            # Messages the renderer chose not to send, e.g. reset tokens used in the meantime
+            covered = {i for _, ids in rendered for i in ids}
+            await self.outbox.mark_sent([i for i in messages_by_id if i not in covered], status="skipped")
+        return len(messages)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = await self.drain_once()
+            except Exception as e:
+                logger.warning(f"Outbox drain failed: {e}")
+                claimed = 0
+            if claimed:
+                continue
+            try:
+                await self.transport.close_if_idle()
+            except Exception as e:
+                logger.warning(f"Closing the idle SMTP connection failed: {e}")
+            self.outbox.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.outbox.wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,469 @@
+"""Full-text search over the text of work PDFs.
+
+Every PDF page is a BM25 document. The index is a list of immutable
+segments, each a directory of NumPy arrays that readers memory-map:
+
+    term_hashes.npy   uint64  sorted 64-bit hashes of the segment's terms
+    term_offsets.npy  int64   postings of term i are [offsets[i], offsets[i + 1])
+    postings_doc.npy  int32   segment-local page number of each posting
+    postings_tf.npy   uint16  term frequency in that page
+    doc_lengths.npy   int32   terms per page
+    doc_pages.npy     int32   page number within its PDF, from 1
+    doc_levels.npy    int8    level of the work the page belongs to
+    doc_work.npy      int32   index into works.json
+    works.json                work ids
+
+manifest.json lists the live segments and the tombstones. Ingesting a
+work writes a new segment and commits it to the manifest under a file
+lock, so any process may write. Once MERGE_FACTOR segments of similar size
+pile up they are merged into one. A tombstone maps a work id to a
+generation and hides that work's pages in every older segment, which is
+how deletions and re-ingests take effect without rewriting segments.
+
+    python backend/search.py backfill   # index works that were never indexed
+    python backend/search.py stats
+"""
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import sys
+import threading
+import unicodedata
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from pypdf import PdfReader
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Segments in the same power-of-ten size tier are merged once there are this many
+MERGE_FACTOR = 10
+MAX_TERM_FREQUENCY = np.iinfo(np.uint16).max
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a o as os e é de da do das dos em no na nos nas um uma uns umas por pelo pela para com sem que "
+    "se ao aos à às ou mas como mais seu sua seus suas lhe ele ela eles elas isso este esta "
+    "the and of to in is for on with".split()
+)
+MANIFEST = "manifest.json"
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents, so 'Salomão' and 'salomao' match"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(normalize(text))
+            if len(token) > 1 and token not in STOPWORDS]
+
+
+def hash_terms(terms: List[str]) -> np.ndarray:
+    return np.fromiter(
+        (int.from_bytes(hashlib.blake2b(term.encode(), digest_size=8).digest(), "little") for term in terms),
+        dtype=np.uint64, count=len(terms)
+    )
+
+
+def extract_pages(pdf_path: str) -> List[str]:
+    reader = PdfReader(pdf_path)
+    pages = []
+    for number, page in enumerate(reader.pages, start=1):
+        try:
+            pages.append(page.extract_text() or "")
+        except Exception as e:
+            logger.warning(f"Could not extract page {number} of {pdf_path}: {e}")
+            pages.append("")
+    return pages
+
+
+# Manifest
+
+def read_manifest(index_dir: Path) -> dict:
+    try:
+        return json.loads((index_dir / MANIFEST).read_text())
+    except FileNotFoundError:
+        return {"generation": 0, "segments": [], "deleted": {}}
+
+
+def write_manifest(index_dir: Path, manifest: dict):
+    temp_path = index_dir / f".{MANIFEST}.{uuid.uuid4().hex}"
+    temp_path.write_text(json.dumps(manifest))
+    os.replace(temp_path, index_dir / MANIFEST)
+
+
+@contextmanager
+def manifest_lock(index_dir: Path):
+    """Serialize manifest updates between processes"""
+    index_dir.mkdir(parents=True, exist_ok=True)
+    with open(index_dir / ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Segments
+
+class Segment:
+    """Read-only, memory-mapped view of one segment directory"""
+
+    ARRAYS = ("term_hashes", "term_offsets", "postings_doc", "postings_tf",
+              "doc_lengths", "doc_pages", "doc_levels", "doc_work")
+
+    def __init__(self, path: Path, generation: int):
+        self.path = path
+        self.generation = generation
+        for name in self.ARRAYS:
+            # A plain ndarray view of the mapping indexes faster than np.memmap
+            setattr(self, name, np.asarray(np.load(path / f"{name}.npy", mmap_mode="r")))
+        self.work_ids = json.loads((path / "works.json").read_text())
+        self._work_index = None
+
+    def hidden_works(self, deleted: Dict[str, int]) -> Optional[np.ndarray]:
+        """Mask over work_ids of works tombstoned after this segment was written, or None"""
+        if not deleted:
+            return None
+        hidden = np.zeros(len(self.work_ids), dtype=bool)
+        if len(deleted) < len(self.work_ids):
+            if self._work_index is None:
+                self._work_index = {work_id: i for i, work_id in enumerate(self.work_ids)}
+            for work_id, generation in deleted.items():
+                i = self._work_index.get(work_id)
+                if i is not None and generation > self.generation:
+                    hidden[i] = True
+        else:
+            for i, work_id in enumerate(self.work_ids):
+                hidden[i] = deleted.get(work_id, 0) > self.generation
+        return hidden if hidden.any() else None
+
+
+def write_segment(index_dir: Path, work_ids: List[str], doc_work, doc_levels, doc_pages, doc_lengths,
+                  posting_terms, posting_docs, posting_tfs) -> dict:
+    """Write the arrays of one segment to a new directory and describe it for the manifest"""
+    order = np.lexsort((posting_docs, posting_terms))
+    posting_terms = posting_terms[order]
+    term_hashes, starts = np.unique(posting_terms, return_index=True)
+    arrays = {
+        "term_hashes": term_hashes.astype(np.uint64),
+        "term_offsets": np.append(starts, len(posting_terms)).astype(np.int64),
+        "postings_doc": posting_docs[order].astype(np.int32),
+        "postings_tf": posting_tfs[order].astype(np.uint16),
+        "doc_lengths": np.asarray(doc_lengths, dtype=np.int32),
+        "doc_pages": np.asarray(doc_pages, dtype=np.int32),
+        "doc_levels": np.asarray(doc_levels, dtype=np.int8),
+        "doc_work": np.asarray(doc_work, dtype=np.int32),
+    }
+    name = f"seg-{uuid.uuid4().hex}"
+    temp_dir = index_dir / f".{name}"
+    temp_dir.mkdir(parents=True)
+    for array_name, array in arrays.items():
+        np.save(temp_dir / f"{array_name}.npy", array)
+    (temp_dir / "works.json").write_text(json.dumps(work_ids))
+    os.replace(temp_dir, index_dir / name)
+    return {"name": name, "docs": len(arrays["doc_lengths"]), "total_length": int(arrays["doc_lengths"].sum())}
+
+
+def build_segment(index_dir: Path, works: List[dict]) -> Optional[dict]:
+    """Write a segment for works given as {"id", "level", "pages": [text, ...]}; None if no page has text"""
+    doc_work, doc_levels, doc_pages, doc_lengths = [], [], [], []
+    posting_terms, posting_docs, posting_tfs = [], [], []
+    for work_index, work in enumerate(works):
+        for page_number, text in enumerate(work["pages"], start=1):
+            counts = Counter(tokenize(text))
+            if not counts:
+                continue
+            doc = len(doc_lengths)
+            doc_work.append(work_index)
+            doc_levels.append(work["level"])
+            doc_pages.append(page_number)
+            doc_lengths.append(sum(counts.values()))
+            posting_terms.append(hash_terms(list(counts)))
+            posting_docs.append(np.full(len(counts), doc, dtype=np.int32))
+            posting_tfs.append(np.minimum(np.fromiter(counts.values(), dtype=np.int64), MAX_TERM_FREQUENCY))
+    if not doc_lengths:
+        return None
+    return write_segment(
+        index_dir, [work["id"] for work in works], doc_work, doc_levels, doc_pages, doc_lengths,
+        np.concatenate(posting_terms), np.concatenate(posting_docs), np.concatenate(posting_tfs)
+    )
+
+
+def _merge(index_dir: Path, infos: List[dict], deleted: Dict[str, int]) -> Optional[dict]:
+    """Write one segment holding the visible pages of the given segments"""
+    work_ids = []
+    doc_arrays = {"doc_work": [], "doc_levels": [], "doc_pages": [], "doc_lengths": []}
+    posting_terms, posting_docs, posting_tfs = [], [], []
+    doc_base = 0
+    for info in infos:
+        segment = Segment(index_dir / info["name"], info["generation"])
+        hidden = segment.hidden_works(deleted)
+        keep_doc = np.ones(len(segment.doc_lengths), dtype=bool) if hidden is None else ~hidden[segment.doc_work]
+        new_doc = np.cumsum(keep_doc) - 1 + doc_base
+        kept_works = np.unique(segment.doc_work[keep_doc])
+        new_work = np.full(len(segment.work_ids), -1, dtype=np.int64)
+        new_work[kept_works] = np.arange(len(kept_works)) + len(work_ids)
+        work_ids.extend(segment.work_ids[i] for i in kept_works)
+
+        doc_arrays["doc_work"].append(new_work[segment.doc_work[keep_doc]])
+        for name in ("doc_levels", "doc_pages", "doc_lengths"):
+            doc_arrays[name].append(np.asarray(getattr(segment, name))[keep_doc])
+
+        keep_posting = keep_doc[segment.postings_doc]
+        terms = np.repeat(segment.term_hashes, np.diff(segment.term_offsets))
+        posting_terms.append(terms[keep_posting])
+        posting_docs.append(new_doc[segment.postings_doc[keep_posting]])
+        posting_tfs.append(np.asarray(segment.postings_tf)[keep_posting])
+        doc_base += int(keep_doc.sum())
+    if not doc_base:
+        return None
+    return write_segment(
+        index_dir, work_ids, *(np.concatenate(doc_arrays[name]) for name in doc_arrays),
+        np.concatenate(posting_terms), np.concatenate(posting_docs), np.concatenate(posting_tfs)
+    )
+
+
+def merge_segments(index_dir: Path):
+    """Merge size tiers that have MERGE_FACTOR or more segments, repeating while any does"""
+    while True:
+        with manifest_lock(index_dir):
+            manifest = read_manifest(index_dir)
+            tiers: Dict[int, List[dict]] = {}
+            for info in manifest["segments"]:
+                tiers.setdefault(int(math.log10(max(1, info["docs"]))), []).append(info)
+            full_tiers = [infos for infos in tiers.values() if len(infos) >= MERGE_FACTOR]
+            if not full_tiers:
+                return
+            chosen = full_tiers[0]
+            merged = _merge(index_dir, chosen, manifest["deleted"])
+            chosen_names = {info["name"] for info in chosen}
+            segments = [info for info in manifest["segments"] if info["name"] not in chosen_names]
+            if merged:
+                merged["generation"] = max(info["generation"] for info in chosen)
+                segments.append(merged)
+            manifest["segments"] = segments
+            # A tombstone no older than every segment hides nothing any more
+            oldest = min((info["generation"] for info in segments), default=math.inf)
+            manifest["deleted"] = {work_id: generation for work_id, generation in manifest["deleted"].items()
+                                   if generation > oldest}
+            write_manifest(index_dir, manifest)
+        for name in chosen_names:
+            shutil.rmtree(index_dir / name, ignore_errors=True)
+
+
+def ingest_work(index_dir: str, work_id: str, level: int, pdf_path: str, replace: bool = False) -> int:
+    """Extract a work's PDF and add its pages to the index; returns the number of pages.
+
+    With replace, pages from an earlier ingest of the same work are hidden.
+    Meant to run in a worker process.
+    """
+    index_dir = Path(index_dir)
+    pages = extract_pages(pdf_path)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    segment = build_segment(index_dir, [{"id": work_id, "level": level, "pages": pages}])
+    with manifest_lock(index_dir):
+        manifest = read_manifest(index_dir)
+        manifest["generation"] += 1
+        if replace:
+            manifest["deleted"][work_id] = manifest["generation"]
+        if segment:
+            segment["generation"] = manifest["generation"]
+            manifest["segments"].append(segment)
+        write_manifest(index_dir, manifest)
+    merge_segments(index_dir)
+    return len(pages)
+
+
+def remove_work(index_dir: str, work_id: str):
+    """Hide every indexed page of a work"""
+    index_dir = Path(index_dir)
+    if not (index_dir / MANIFEST).exists():
+        return
+    with manifest_lock(index_dir):
+        manifest = read_manifest(index_dir)
+        manifest["generation"] += 1
+        manifest["deleted"][work_id] = manifest["generation"]
+        write_manifest(index_dir, manifest)
+
+
+# Queries
+
+class SearchIndex:
+    """Query side of the index; picks up new manifests written by any process"""
+
+    def __init__(self, index_dir: Path):
+        self.index_dir = Path(index_dir)
+        self._lock = threading.Lock()
+        self._manifest_key = None
+        self._segments: Dict[str, Segment] = {}
+        # (segment, mask of hidden pages or None, BM25 length norm per page) for every live segment
+        self._view = []
+        self.total_docs = 0
+        self.average_length = 0.0
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.index_dir / MANIFEST)
+        except FileNotFoundError:
+            self._view, self.total_docs = [], 0
+            return
+        # The manifest is replaced, never rewritten, so a new inode means a new version
+        key = (stat.st_ino, stat.st_mtime_ns)
+        if key == self._manifest_key:
+            return
+        manifest = read_manifest(self.index_dir)
+        self.total_docs = sum(info["docs"] for info in manifest["segments"])
+        total_length = sum(info["total_length"] for info in manifest["segments"])
+        self.average_length = total_length / self.total_docs if self.total_docs else 0.0
+        segments, view = {}, []
+        for info in manifest["segments"]:
+            segment = self._segments.get(info["name"]) or Segment(self.index_dir / info["name"], info["generation"])
+            segments[info["name"]] = segment
+            hidden = segment.hidden_works(manifest["deleted"])
+            norm = (BM25_K1 * (1 - BM25_B + BM25_B * segment.doc_lengths / self.average_length)).astype(np.float32)
+            view.append((segment, None if hidden is None else hidden[segment.doc_work], norm))
+        self._segments, self._view = segments, view
+        self._manifest_key = key
+
+    def search(self, query: str, max_level: int, limit: int = 20) -> List[dict]:
+        """Best-matching works up to max_level as [{"work_id", "score", "page"}], best first.
+
+        Each work is scored by its best page, which is returned with it.
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms:
+            return []
+        with self._lock:
+            try:
+                self._refresh()
+            except FileNotFoundError:
+                # A merge removed a segment between reading the manifest and opening it
+                self._manifest_key = None
+                self._refresh()
+            view, total_docs = self._view, self.total_docs
+        if not total_docs:
+            return []
+
+        hashes = hash_terms(terms)
+        ranges = []
+        document_frequency = np.zeros(len(hashes))
+        for segment, _, _ in view:
+            position = np.searchsorted(segment.term_hashes, hashes)
+            clipped = np.minimum(position, len(segment.term_hashes) - 1)
+            found = (position < len(segment.term_hashes)) & (segment.term_hashes[clipped] == hashes)
+            starts = np.where(found, segment.term_offsets[clipped], 0)
+            ends = np.where(found, segment.term_offsets[clipped + 1], 0)
+            ranges.append((starts, ends))
+            document_frequency += ends - starts
+        idf = np.log(1 + (total_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+
+        best = {}
+        idf = idf.astype(np.float32)
+        for (segment, hidden, norm), (starts, ends) in zip(view, ranges):
+            if not np.any(ends > starts):
+                continue
+            docs = np.concatenate([segment.postings_doc[s:e] for s, e in zip(starts, ends)])
+            tfs = np.concatenate([segment.postings_tf[s:e] for s, e in zip(starts, ends)]).astype(np.float32)
+            contributions = np.repeat(idf, ends - starts) * tfs * (BM25_K1 + 1) / (tfs + norm[docs])
+            if len(docs) * 16 < len(segment.doc_lengths):
+                # Few postings: summing per distinct page beats a pass over every page
+                hits, inverse = np.unique(docs, return_inverse=True)
+                scores = np.bincount(inverse, weights=contributions)
+            else:
+                scores = np.bincount(docs, weights=contributions)
+                hits = np.flatnonzero(scores)
+                scores = scores[hits]
+
+            visible = segment.doc_levels[hits] <= max_level
+            if hidden is not None:
+                visible &= ~hidden[hits]
+            hits, scores = hits[visible], scores[visible]
+            for i in self._top_pages(segment, hits, scores, limit):
+                doc = hits[i]
+                work_id = segment.work_ids[segment.doc_work[doc]]
+                score = float(scores[i])
+                if work_id not in best or best[work_id]["score"] < score:
+                    best[work_id] = {"work_id": work_id, "score": score, "page": int(segment.doc_pages[doc])}
+        return sorted(best.values(), key=lambda hit: -hit["score"])[:limit]
+
+    @staticmethod
+    def _top_pages(segment: Segment, hits: np.ndarray, scores: np.ndarray, limit: int) -> np.ndarray:
+        """Positions in hits of the best page of each of the top `limit` works"""
+        candidates = limit * 8
+        while True:
+            if len(hits) > candidates:
+                top = np.argpartition(-scores, candidates)[:candidates]
+            else:
+                top = np.arange(len(hits))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            _, first = np.unique(segment.doc_work[hits[top]], return_index=True)
+            # Many pages of a few works can crowd out the others; widen until limit works are found
+            if len(first) >= limit or len(top) == len(hits):
+                return top[np.sort(first)][:limit]
+            candidates *= 4
+
+
+async def _main(command: str) -> int:
+    from concurrent.futures import ProcessPoolExecutor
+    from datetime import datetime, timezone
+
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    index_dir = Path(os.environ.get('SEARCH_INDEX_DIR', '/app/backend/search_index'))
+
+    if command == "stats":
+        manifest = read_manifest(index_dir)
+        print(f"segments:   {len(manifest['segments'])}")
+        print(f"pages:      {sum(info['docs'] for info in manifest['segments'])}")
+        print(f"tombstones: {len(manifest['deleted'])}")
+        return 0
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    loop = asyncio.get_running_loop()
+    failed = 0
+    try:
+        works = await db.work_files.find(
+            {"search_indexed_at": {"$exists": False}}, {"_id": 0, "id": 1, "level": 1, "file_path": 1}
+        ).to_list(None)
+        with ProcessPoolExecutor() as executor:
+            futures = [loop.run_in_executor(executor, ingest_work, str(index_dir), work["id"], work["level"],
+                                            work["file_path"]) for work in works]
+            for work, future in zip(works, futures):
+                try:
+                    pages = await future
+                except Exception as e:
+                    print(f"failed: {work['id']} ({e})")
+                    failed += 1
+                    continue
+                await db.work_files.update_one(
+                    {"id": work["id"]},
+                    {"$set": {"search_pages": pages, "search_indexed_at": datetime.now(timezone.utc)}}
+                )
+        print(f"indexed {len(works) - failed} of {len(works)} works")
+        return 1 if failed else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("backfill", "stats"):
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
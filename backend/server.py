@@ -1,21 +1,48 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, BackgroundTasks, Query, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
 from passlib.context import CryptContext
+from passlib.hash import bcrypt as bcrypt_hash
 from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel, EmailStr, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
+from collections import OrderedDict
+from email.message import EmailMessage
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import asyncio
+import base64
+import hashlib
+import hmac
+import ipaddress
+import json
 import jwt
+import math
 import os
+import time
 import uuid
+import zipfile
+import zlib
 from dotenv import load_dotenv
 from pathlib import Path
+from urllib.parse import quote
 import logging
 import aiofiles
 import secrets
-import string
+
+from compression import CompressionMiddleware
+from indexes import apply_indexes
+from jobs import JobQueue, JobWorkerPool, new_job
+from outbox import LogTransport, Outbox, OutboxSender, SmtpTransport
+from search import SearchIndex, ingest_work, remove_work
+from metrics import (
+    MetricsMiddleware, MongoCommandMetrics, PASSWORD_HASH_IN_FLIGHT, PASSWORD_HASH_QUEUE_DEPTH,
+    monitor_event_loop_lag, render_metrics
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -24,17 +51,108 @@ load_dotenv(ROOT_DIR / '.env')
 SECRET_KEY = os.environ.get('SECRET_KEY', 'masonic_temple_secret_key_2024')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.environ.get('REFRESH_TOKEN_EXPIRE_DAYS', '14'))
+# A rotated token presented again within this many seconds is taken for two
+# tabs refreshing at once rather than a leak, and doesn't revoke the session
+REFRESH_TOKEN_REUSE_GRACE_SECONDS = int(os.environ.get('REFRESH_TOKEN_REUSE_GRACE_SECONDS', '10'))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get('PRINCIPAL_CACHE_MAX_ENTRIES', '1024'))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.environ.get('PRINCIPAL_CACHE_TTL_SECONDS', '60'))
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')  # thread or process
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', '64'))
+# Login attempts allowed per email and per client IP within a sliding window (0 disables a limit)
+LOGIN_THROTTLE_WINDOW_SECONDS = float(os.environ.get('LOGIN_THROTTLE_WINDOW_SECONDS', '300'))
+LOGIN_THROTTLE_MAX_PER_EMAIL = int(os.environ.get('LOGIN_THROTTLE_MAX_PER_EMAIL', '10'))
+# Off unless configured: behind a proxy every member shares the proxy's address
+# unless TRUSTED_PROXIES lets the client address be read from X-Forwarded-For
+LOGIN_THROTTLE_MAX_PER_IP = int(os.environ.get('LOGIN_THROTTLE_MAX_PER_IP', '0'))
+LOGIN_THROTTLE_MAX_KEYS = int(os.environ.get('LOGIN_THROTTLE_MAX_KEYS', '100000'))
+# memory: per worker process; mongo: shared by every worker through the login_throttle_buckets collection
+LOGIN_THROTTLE_BACKEND = os.environ.get('LOGIN_THROTTLE_BACKEND', 'memory')
+# Reverse proxies (addresses or networks, comma separated) whose X-Forwarded-For is believed
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip(), strict=False)
+    for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy.strip()
+]
+# Pin the bcrypt cost explicitly, or give a verify-time budget to calibrate against at startup
+PASSWORD_HASH_ROUNDS = os.environ.get('PASSWORD_HASH_ROUNDS')
+PASSWORD_HASH_TARGET_MS = os.environ.get('PASSWORD_HASH_TARGET_MS')
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Operations accepted by one /admin/users/bulk request
+BULK_USER_MAX_OPERATIONS = int(os.environ.get('BULK_USER_MAX_OPERATIONS', '1000'))
+RESET_TOKEN_TTL = timedelta(hours=1)
+# A live token is sent again instead of minting a new one while it has this much validity left
+RESET_TOKEN_REUSE_MIN_REMAINING = timedelta(minutes=10)
+UPLOAD_DIR = Path(os.environ.get('UPLOAD_DIR', '/app/backend/uploads'))
+BLOB_DIR = UPLOAD_DIR / "blobs"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+PDF_MAGIC = b"%PDF-"
+ZIP_MAGIC = b"PK\x03\x04"
+# PDFs, counting ZIP entries, accepted by one /upload-works request
+BULK_UPLOAD_MAX_ENTRIES = int(os.environ.get('BULK_UPLOAD_MAX_ENTRIES', '5000'))
+# Entries of one bulk upload staged at the same time
+BULK_UPLOAD_CONCURRENCY = int(os.environ.get('BULK_UPLOAD_CONCURRENCY', '4'))
+# Work files never change once stored, so clients may cache them for good
+FILE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+FILE_STREAM_CHUNK_SIZE = 64 * 1024
+MAX_BYTE_RANGES = 16
+DOWNLOAD_URL_TTL_SECONDS = int(os.environ.get('DOWNLOAD_URL_TTL_SECONDS', '300'))
+# app: stream from this process; x-accel-redirect (nginx) or x-sendfile: let the proxy send the file
+FILE_DELIVERY_MODE = os.environ.get('FILE_DELIVERY_MODE', 'app')
+FILE_DELIVERY_INTERNAL_PREFIX = os.environ.get('FILE_DELIVERY_INTERNAL_PREFIX', '/protected-uploads/')
+if FILE_DELIVERY_MODE not in ("app", "x-accel-redirect", "x-sendfile"):
+    raise ValueError(f"Unknown FILE_DELIVERY_MODE: {FILE_DELIVERY_MODE}")
+# in-process: every web worker also runs background jobs; external: only backend/worker.py does
+JOB_WORKER_MODE = os.environ.get('JOB_WORKER_MODE', 'in-process')
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', '4'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '60'))
+if JOB_WORKER_MODE not in ("in-process", "external"):
+    raise ValueError(f"Unknown JOB_WORKER_MODE: {JOB_WORKER_MODE}")
+# Without SMTP_HOST, outgoing emails are only logged
+SMTP_HOST = os.environ.get('SMTP_HOST')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+# starttls, ssl (implicit TLS, usually port 465) or none
+SMTP_SECURITY = os.environ.get('SMTP_SECURITY', 'starttls')
+SMTP_FROM = os.environ.get('SMTP_FROM', 'noreply@localhost')
+# Close the pooled SMTP connection after this long without mail
+SMTP_IDLE_SECONDS = float(os.environ.get('SMTP_IDLE_SECONDS', '60'))
+if SMTP_SECURITY not in ("starttls", "ssl", "none"):
+    raise ValueError(f"Unknown SMTP_SECURITY: {SMTP_SECURITY}")
+# New registrations are collected into one admin digest per this many seconds
+OUTBOX_DIGEST_SECONDS = float(os.environ.get('OUTBOX_DIGEST_SECONDS', '60'))
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+SEARCH_INDEX_DIR = Path(os.environ.get('SEARCH_INDEX_DIR', '/app/backend/search_index'))
+SEARCH_INGEST_WORKERS = int(os.environ.get('SEARCH_INGEST_WORKERS', '1'))
+# Responses smaller than this are not worth compressing
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get('COMPRESSION_MINIMUM_SIZE', '1024'))
+COMPRESSION_CACHE_MAX_BYTES = int(os.environ.get('COMPRESSION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+# Listings whose bodies repeat between requests; their compressed bodies are cached
+COMPRESSION_CACHED_ROUTES = (
+    "/api/admin/pending-users",
+    "/api/admin/all-users",
+    "/api/works",
+    "/api/works/{level}",
+    "/api/users-with-works",
+)
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL'] 
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
+job_queue = JobQueue(db, JOB_LEASE_SECONDS)
+outbox = Outbox(db, digest_kinds={"registration_digest"})
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # FastAPI app
-app = FastAPI(title="R:.L:. VASCO DA GAMA Nº12 Access System")
+app = FastAPI(title="R:.L:. VASCO DA GAMA Nº12 Access System", default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Security
@@ -90,6 +208,18 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: dict
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class BulkUserOperation(BaseModel):
+    action: Literal["approve", "reject", "delete", "change_level"]
+    user_id: str
+    new_level: Optional[int] = None
+
+class BulkUserRequest(BaseModel):
+    operations: List[BulkUserOperation] = Field(..., min_length=1, max_length=BULK_USER_MAX_OPERATIONS)
 
 class PendingApproval(BaseModel):
     id: str
@@ -108,18 +238,95 @@ class WorkFile(BaseModel):
     uploaded_by: str
     uploaded_by_name: str
     uploaded_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+class PendingApprovalPage(BaseModel):
+    items: List[PendingApproval]
+    next_cursor: Optional[str] = None
+
+class WorkFilePage(BaseModel):
+    items: List[WorkFile]
+    next_cursor: Optional[str] = None
 
 class WorkFileUpload(BaseModel):
     title: str
 
+class UploadPreflight(BaseModel):
+    sha256: str = Field(..., pattern=r"^[0-9a-f]{64}$")
+    filename: str
+
 class PasswordResetToken(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     email: str
-    token: str
+    nonce: str = Field(default_factory=lambda: secrets.token_hex(16))
+    token_hash: str
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     expires_at: datetime
     used: bool = False
 
+class RefreshToken(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    user_id: str
+    email: str
+    # Every token rotated from the same login shares a family
+    family_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    token_hash: str
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    expires_at: datetime
+    rotated_at: Optional[datetime] = None
+
+# Listing projections: only the fields a response carries, never password hashes.
+# Rows fetched with these are returned as-is instead of being rebuilt as models.
+USER_LIST_PROJECTION = {"_id": 0, "id": 1, "email": 1, "full_name": 1, "level": 1, "status": 1, "created_at": 1}
+WORK_PROJECTION = {"_id": 0, **{field_name: 1 for field_name in WorkFile.model_fields}}
+
+# Principal cache
+class PrincipalCache:
+    """Bounded LRU of authenticated user documents keyed by token subject.
+
+    Entries expire after ``ttl_seconds`` so changes made by other workers
+    are picked up eventually; changes made by this process invalidate the
+    entry immediately.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+
+    def get(self, subject: str):
+        entry = self._entries.get(subject)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[subject]
+            return None
+        self._entries.move_to_end(subject)
+        return user
+
+    def put(self, subject: str, user: dict):
+        if self.max_entries <= 0:
+            return
+        self._entries[subject] = (time.monotonic() + self.ttl_seconds, user)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, email: Optional[str] = None, user_id: Optional[str] = None):
+        if email is not None:
+            self._entries.pop(email, None)
+        if user_id is not None:
+            for subject, (_, user) in list(self._entries.items()):
+                if user.get("id") == user_id:
+                    del self._entries[subject]
+
+    def clear(self):
+        self._entries.clear()
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_MAX_ENTRIES, PRINCIPAL_CACHE_TTL_SECONDS)
+
 # Helper functions
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -127,9 +334,536 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def generate_reset_token():
-    """Generate a secure random token for password reset"""
-    return ''.join(secrets.choice(string.ascii_letters + string.digits) for _ in range(32))
+def calibrate_bcrypt_rounds(target_ms: float, min_rounds: int = BCRYPT_MIN_ROUNDS, max_rounds: int = BCRYPT_MAX_ROUNDS) -> int:
+    """Pick the highest bcrypt cost whose verify time fits in target_ms on this machine"""
+    sample_hash = bcrypt_hash.using(rounds=min_rounds).hash("calibration")
+    started = time.perf_counter()
+    bcrypt_hash.verify("calibration", sample_hash)
+    base_ms = (time.perf_counter() - started) * 1000
+    
+    # Every extra round doubles the work
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds
+
+def set_bcrypt_rounds(rounds: int):
+    pwd_context.update(
+        bcrypt__default_rounds=rounds,
+        bcrypt__min_rounds=rounds,
+        bcrypt__max_rounds=rounds
+    )
+
+def apply_password_policy(rounds: int):
+    """Hash new passwords with the given cost and flag any other cost as needing an update.
+
+    bcrypt stores its cost inside each hash, so existing users keep verifying
+    against their own parameters until they are rehashed on login.
+    """
+    set_bcrypt_rounds(rounds)
+    password_hasher.set_rounds(rounds)
+
+def init_password_hash_worker(rounds: Optional[int]):
+    # A spawned worker imports this module afresh, with the default cost
+    if rounds:
+        set_bcrypt_rounds(rounds)
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification in a dedicated worker pool.
+
+    Keeps the event loop free while a hash is computed. At most
+    ``workers + max_queue`` operations may be in flight; beyond that callers
+    get a 503 instead of piling up behind the pool.
+    """
+
+    def __init__(self, executor_kind: str, workers: int, max_queue: int):
+        if executor_kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {executor_kind}")
+        self.executor_kind = executor_kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        # Moving average of how long a verify takes, queueing included
+        self.verify_seconds: Optional[float] = None
+        # Cost set by apply_password_policy, handed to process workers
+        self.rounds: Optional[int] = None
+        self._executor: Optional[Executor] = None
+        self._decoy_hash: Optional[str] = None
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                # spawn, not fork: this process already runs motor's and the executors' threads
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_password_hash_worker,
+                    initargs=(self.rounds,)
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="pwhash")
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.in_flight >= self.workers + self.max_queue:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please try again",
+                headers={"Retry-After": "1"}
+            )
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        started = time.perf_counter()
+        result = await self._run(verify_password, plain_password, hashed_password)
+        elapsed = time.perf_counter() - started
+        self.verify_seconds = elapsed if self.verify_seconds is None else 0.9 * self.verify_seconds + 0.1 * elapsed
+        return result
+
+    async def verify_unknown(self):
+        """Take as long as a verify would, for a login whose email matches no user.
+
+        Once a real verify has been timed this only sleeps, so unknown emails
+        cost no pool capacity yet answer no faster than wrong passwords.
+        """
+        if self.verify_seconds is None:
+            if self._decoy_hash is None:
+                self._decoy_hash = await self._run(get_password_hash, secrets.token_hex(16))
+            await self.verify(secrets.token_hex(16), self._decoy_hash)
+            return
+        await asyncio.sleep(self.verify_seconds)
+
+    def set_rounds(self, rounds: int):
+        self.rounds = rounds
+        if self.executor_kind == "process" and self._executor is not None:
+            # Workers keep the policy they started with; let them finish and start new ones
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+PASSWORD_HASH_QUEUE_DEPTH.set_function(lambda: password_hasher.queue_depth)
+PASSWORD_HASH_IN_FLIGHT.set_function(lambda: password_hasher.in_flight)
+
+class LoginThrottle:
+    """Sliding-window limit on login attempts per key (an email or a client IP).
+
+    The ``memory`` backend logs attempts per key and refuses an attempt
+    while the key already has ``limit`` attempts within the last
+    ``window_seconds``; it keeps at most ``max_keys`` keys in this process.
+
+    The ``mongo`` backend shares the limit between workers with an atomic
+    counter per key and fixed window in ``login_throttle_buckets``, so
+    concurrent attempts cannot overshoot it. Being a fixed window, a burst
+    straddling a window boundary can get up to twice ``limit`` attempts.
+
+    Refused attempts are not counted, so a client that backs off regains
+    access once the window moves on.
+    """
+
+    def __init__(self, backend: str, window_seconds: float, max_keys: int):
+        if backend not in ("memory", "mongo"):
+            raise ValueError(f"Unknown login throttle backend: {backend}")
+        self.backend = backend
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+
+    def _memory_retry_after(self, key: str, limit: int, now: float) -> float:
+        attempts = self._attempts.get(key)
+        if not attempts:
+            return 0.0
+        cutoff = now - self.window_seconds
+        while attempts and attempts[0] <= cutoff:
+            attempts.pop(0)
+        if not attempts:
+            del self._attempts[key]
+            return 0.0
+        if len(attempts) < limit:
+            return 0.0
+        return attempts[-limit] + self.window_seconds - now
+
+    def _memory_record(self, key: str, now: float):
+        self._attempts.setdefault(key, []).append(now)
+        self._attempts.move_to_end(key)
+        while len(self._attempts) > self.max_keys:
+            self._attempts.popitem(last=False)
+
+    async def _mongo_hit(self, limits: dict, now: datetime) -> float:
+        window_start = math.floor(now.timestamp() / self.window_seconds) * self.window_seconds
+        window = datetime.fromtimestamp(window_start, timezone.utc)
+        buckets = await asyncio.gather(*[
+            db.login_throttle_buckets.find_one_and_update(
+                {"key": key, "window": window},
+                {
+                    "$inc": {"count": 1},
+                    "$setOnInsert": {"expires_at": window + timedelta(seconds=self.window_seconds)}
+                },
+                projection={"_id": 0, "count": 1},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            for key in limits
+        ])
+        if all(bucket["count"] <= limits[key] for key, bucket in zip(limits, buckets)):
+            return 0.0
+        # Take the refused attempt back from every key it was counted against
+        await asyncio.gather(*[
+            db.login_throttle_buckets.update_one({"key": key, "window": window}, {"$inc": {"count": -1}})
+            for key in limits
+        ])
+        return window_start + self.window_seconds - now.timestamp()
+
+    async def hit(self, limits: dict) -> float:
+        """Log an attempt against every key in ``limits`` ({key: limit}).
+
+        Returns 0 when the attempt is allowed, otherwise the seconds until
+        it would be, in which case nothing is logged.
+        """
+        limits = {key: limit for key, limit in limits.items() if limit > 0}
+        if self.backend == "memory":
+            now = time.monotonic()
+            retry_after = max([self._memory_retry_after(key, limit, now) for key, limit in limits.items()], default=0.0)
+            if retry_after <= 0:
+                for key in limits:
+                    self._memory_record(key, now)
+            return max(0.0, retry_after)
+
+        if not limits:
+            return 0.0
+        return max(0.0, await self._mongo_hit(limits, datetime.now(timezone.utc)))
+
+    async def reset(self, key: str):
+        """Forget a key's attempts, e.g. an email after a successful login"""
+        if self.backend == "memory":
+            self._attempts.pop(key, None)
+        else:
+            await db.login_throttle_buckets.delete_many({"key": key})
+
+login_throttle = LoginThrottle(LOGIN_THROTTLE_BACKEND, LOGIN_THROTTLE_WINDOW_SECONDS, LOGIN_THROTTLE_MAX_KEYS)
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_address(request: Request) -> str:
+    """The client's IP address, read from X-Forwarded-For only when the peer is a trusted proxy"""
+    peer = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(peer):
+        return peer
+    hops = [hop.strip() for hop in request.headers.get("x-forwarded-for", "").split(",") if hop.strip()]
+    # Walk back from the nearest proxy; earlier hops could be forged by the client
+    for hop in reversed(hops):
+        if not is_trusted_proxy(hop):
+            return hop
+    return hops[0] if hops else peer
+
+# Full-text search
+search_index = SearchIndex(SEARCH_INDEX_DIR)
+search_ingest_executor: Optional[ProcessPoolExecutor] = None
+
+def get_search_ingest_executor() -> ProcessPoolExecutor:
+    global search_ingest_executor
+    if search_ingest_executor is None:
+        # spawn, not fork: this process runs motor's threads. A spawned child
+        # unpickles ingest_work from search.py, but it also re-imports the
+        # parent's __main__ module, so entry points that start this pool
+        # (worker.py) import server only once they are running as __main__
+        search_ingest_executor = ProcessPoolExecutor(
+            max_workers=SEARCH_INGEST_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return search_ingest_executor
+
+async def index_work_text(work_id: str, level: int, file_path: str):
+    """Extract a work's PDF text in a worker process and add its pages to the search index"""
+    work = await db.work_files.find_one({"id": work_id}, {"_id": 0, "search_indexed_at": 1})
+    if work is None:
+        return
+    loop = asyncio.get_running_loop()
+    pages = await loop.run_in_executor(
+        get_search_ingest_executor(), ingest_work, str(SEARCH_INDEX_DIR), work_id, level, file_path,
+        "search_indexed_at" in work
+    )
+    result = await db.work_files.update_one(
+        {"id": work_id},
+        {"$set": {"search_pages": pages, "search_indexed_at": datetime.now(timezone.utc)}}
+    )
+    if result.matched_count == 0:
+        # Deleted while its text was being extracted
+        await loop.run_in_executor(None, remove_work, str(SEARCH_INDEX_DIR), work_id)
+
+async def rehash_password(user_id: str, plain_password: str, old_hash: str):
+    """Upgrade a stored hash to the current policy after a successful login"""
+    try:
+        new_hash = await password_hasher.hash(plain_password)
+        # Only replace the hash we verified, in case the password changed meanwhile
+        await db.users.update_one(
+            {"id": user_id, "password_hash": old_hash},
+            {"$set": {"password_hash": new_hash}}
+        )
+        principal_cache.invalidate(user_id=user_id)
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Failed to rehash password for user {user_id}: {e}")
+
+def derive_reset_token(email: str, nonce: str) -> str:
+    """Rebuild the reset token sent by email from its stored nonce.
+
+    Only the token's hash is stored, and the token cannot be derived from
+    the nonce without SECRET_KEY.
+    """
+    message = f"reset:{email}:{nonce}".encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+def hash_reset_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def issue_refresh_token(user: dict, family_id: Optional[str] = None) -> str:
+    """Store a new refresh token for user and return it; only its hash is kept"""
+    token = secrets.token_urlsafe(32)
+    refresh_token = RefreshToken(
+        user_id=user["id"],
+        email=user["email"],
+        token_hash=hash_refresh_token(token),
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+    if family_id:
+        refresh_token.family_id = family_id
+    await db.refresh_tokens.insert_one(refresh_token.dict())
+    return token
+
+async def revoke_refresh_tokens(email: Optional[str] = None, user_id: Optional[str] = None,
+                                user_ids: Optional[List[str]] = None):
+    """Sign a member out of every session, e.g. after a password change"""
+    if email is not None:
+        await db.refresh_tokens.delete_many({"email": email})
+    if user_id is not None:
+        await db.refresh_tokens.delete_many({"user_id": user_id})
+    if user_ids:
+        await db.refresh_tokens.delete_many({"user_id": {"$in": user_ids}})
+
+def live_reset_token_filter(email: str, token: str) -> dict:
+    return {
+        "token_hash": hash_reset_token(token),
+        "email": email,
+        "used": False,
+        "expires_at": {"$gt": datetime.now(timezone.utc)}
+    }
+
+def encode_cursor(sort_value: Optional[datetime], doc_id: str) -> str:
+    """Build an opaque keyset cursor from the last document of a page"""
+    raw = json.dumps([sort_value.isoformat() if sort_value else None, doc_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, doc_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (datetime.fromisoformat(sort_value) if sort_value else None), str(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def fetch_page(collection, query: dict, sort_field: str, cursor: Optional[str], limit: int, projection: Optional[dict] = None):
+    """Return one page of documents ordered by (sort_field, id) and the cursor for the next one"""
+    if cursor:
+        last_value, last_id = decode_cursor(cursor)
+        if last_value is None:
+            # Documents without the sort field come first; continue past them
+            after = {"$or": [{sort_field: {"$ne": None}}, {sort_field: None, "id": {"$gt": last_id}}]}
+        else:
+            after = {"$or": [{sort_field: {"$gt": last_value}}, {sort_field: last_value, "id": {"$gt": last_id}}]}
+        query = {"$and": [query, after]} if query else after
+    
+    docs = await collection.find(query, projection).sort([(sort_field, 1), ("id", 1)]).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1].get(sort_field), docs[-1]["id"])
+    return docs, next_cursor
+
+async def save_upload(file: UploadFile, destination: Path):
+    """Stream an uploaded PDF to destination one chunk at a time.
+
+    The bytes go to a temporary file next to destination that is renamed
+    into place only once the whole upload passed the size and type checks.
+    Returns the size and SHA-256 hex digest of the stored file.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit"
+        )
+    
+    temp_path = destination.with_name(f".{destination.name}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, 'wb') as f:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(PDF_MAGIC):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Only PDF files are allowed"
+                    )
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit"
+                    )
+                digest.update(chunk)
+                await f.write(chunk)
+        if size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uploaded file is empty"
+            )
+        os.replace(temp_path, destination)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return size, digest.hexdigest()
+
+def stage_archive_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo, destination: Path):
+    """Stream one ZIP entry to destination with the same checks as save_upload.
+
+    Decompresses one chunk at a time, so neither the archive nor the entry
+    is held in memory. Blocking; run it in a thread.
+    """
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit"
+    )
+    if info.file_size > MAX_UPLOAD_BYTES:
+        raise too_large
+    
+    temp_path = destination.with_name(f".{destination.name}.part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with archive.open(info) as source, open(temp_path, 'wb') as f:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(PDF_MAGIC):
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Only PDF files are allowed"
+                    )
+                # The size in the archive header is not trusted
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise too_large
+                digest.update(chunk)
+                f.write(chunk)
+        if size == 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uploaded file is empty"
+            )
+        os.replace(temp_path, destination)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+    return size, digest.hexdigest()
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / sha256[:2] / f"{sha256}.pdf"
+
+async def store_blob(staged_path: Path, sha256: str, size: int) -> Path:
+    """Move a staged upload into content-addressed storage and take a reference to it"""
+    path = blob_path(sha256)
+    await db.blobs.update_one(
+        {"sha256": sha256},
+        {
+            "$inc": {"refcount": 1},
+            "$setOnInsert": {"path": str(path), "size": size, "created_at": datetime.now(timezone.utc)}
+        },
+        upsert=True
+    )
+    try:
+        if path.exists():
+            staged_path.unlink(missing_ok=True)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(staged_path, path)
+    except BaseException:
+        # No work will point at the reference just taken
+        await release_blob(sha256)
+        raise
+    return path
+
+async def acquire_blob(sha256: str) -> Optional[dict]:
+    """Take another reference to a blob the server already stores, if any"""
+    blob = await db.blobs.find_one_and_update(
+        {"sha256": sha256, "refcount": {"$gt": 0}},
+        {"$inc": {"refcount": 1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if blob and not Path(blob["path"]).exists():
+        await db.blobs.update_one({"sha256": sha256}, {"$inc": {"refcount": -1}})
+        return None
+    return blob
+
+async def release_blob(sha256: str) -> bool:
+    """Drop a reference to a blob, queueing its file for deletion when nothing points at it any more.
+
+    Returns False when no blob record exists, e.g. for files stored before
+    content addressing.
+    """
+    blob = await db.blobs.find_one_and_update(
+        {"sha256": sha256},
+        {"$inc": {"refcount": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if blob is None:
+        return False
+    if blob["refcount"] <= 0:
+        result = await db.blobs.delete_one({"sha256": sha256, "refcount": {"$lte": 0}})
+        if result.deleted_count:
+            await job_queue.enqueue("delete_file", {"path": blob["path"], "sha256": sha256})
+    return True
+
+def sign_download(work_id: str, expires: int) -> str:
+    message = f"download:{work_id}:{expires}".encode()
+    return hmac.new(SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+def create_download_url(work_id: str) -> dict:
+    """Short-lived URL that lets the browser fetch one work without the bearer header"""
+    expires = int(time.time()) + DOWNLOAD_URL_TTL_SECONDS
+    signature = sign_download(work_id, expires)
+    return {
+        "url": f"/api/signed-download/{work_id}?expires={expires}&signature={signature}",
+        "expires_at": datetime.fromtimestamp(expires, timezone.utc)
+    }
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -156,9 +890,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except jwt.PyJWTError:
         raise credentials_exception
     
+    user = principal_cache.get(email)
+    if user is not None:
+        return user
+    
     user = await db.users.find_one({"email": email, "$or": [{"status": "approved"}, {"status": {"$exists": False}}]})
     if user is None:
         raise credentials_exception
+    principal_cache.put(email, user)
     return user
 
 async def get_admin_user(current_user = Depends(get_current_user)):
@@ -198,22 +937,94 @@ async def get_super_admin_or_master_user(current_user = Depends(get_current_user
         )
     return current_user
 
-def send_notification_email(user_data):
-    try:
-        # This is a placeholder - you'll need to configure SMTP settings
-        print(f"Email notification: New user registration - {user_data['full_name']} ({user_data['email']})")
-        # In a real implementation, configure SMTP and send email to admin emails
-    except Exception as e:
-        print(f"Failed to send email notification: {e}")
+# Outgoing email. Handlers append to the outbox; OutboxSender renders and sends in batches.
+def new_email(to: List[str], subject: str, body: str) -> EmailMessage:
+    email = EmailMessage()
+    email["From"] = SMTP_FROM
+    email["To"] = ", ".join(to)
+    email["Subject"] = subject
+    email.set_content(body)
+    return email
+
+async def render_registration_digest(messages: List[dict]):
+    # One email for every registration queued since the last digest
+    lines = [f"- {m['payload']['full_name']} <{m['payload']['email']}>" for m in messages]
+    body = (
+        "Novos cadastros aguardando aprovação:\n\n"
+        + "\n".join(lines)
+        + "\n\nAcesse o painel de administração para aprovar ou rejeitar."
+    )
+    subject = f"{len(messages)} novo(s) cadastro(s) aguardando aprovação"
+    return [(new_email(ADMIN_EMAILS, subject, body), [m["id"] for m in messages])]
+
+async def render_password_reset(messages: List[dict]):
+    rendered = []
+    now = datetime.now(timezone.utc)
+    for message in messages:
+        email, nonce = message["payload"]["email"], message["payload"]["nonce"]
+        # The outbox carries the nonce, never the token; skip tokens used or expired since
+        if not await db.password_reset_tokens.find_one(
+            {"email": email, "nonce": nonce, "used": False, "expires_at": {"$gt": now}}, {"_id": 1}
+        ):
+            continue
+        body = (
+            "Recebemos um pedido de recuperação de senha para esta conta.\n\n"
+            f"Token de recuperação: {derive_reset_token(email, nonce)}\n\n"
+            "O token expira em 1 hora. Se você não fez este pedido, ignore este email."
+        )
+        rendered.append((new_email([email], "Recuperação de senha", body), [message["id"]]))
+    return rendered
+
+OUTBOX_RENDERERS = {
+    "registration_digest": render_registration_digest,
+    "password_reset": render_password_reset,
+}
+if SMTP_HOST:
+    email_transport = SmtpTransport(
+        SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+        starttls=SMTP_SECURITY == "starttls", use_ssl=SMTP_SECURITY == "ssl", idle_seconds=SMTP_IDLE_SECONDS,
+    )
+else:
+    email_transport = LogTransport()
+outbox_sender = OutboxSender(outbox, email_transport, OUTBOX_RENDERERS, OUTBOX_BATCH_SIZE)
+
+# Background jobs. A job can run more than once, so every handler must be idempotent.
+async def run_index_work_job(payload: dict):
+    await index_work_text(payload["work_id"], payload["level"], payload["file_path"])
+
+async def run_unindex_work_job(payload: dict):
+    await asyncio.get_running_loop().run_in_executor(None, remove_work, str(SEARCH_INDEX_DIR), payload["work_id"])
+
+async def run_delete_file_job(payload: dict):
+    path = Path(payload["path"])
+    sha256 = payload.get("sha256")
 
-def send_password_reset_email(email, reset_token):
+    async def referenced() -> bool:
+        # The same content may have been uploaded again since the file was released
+        return bool(sha256) and await db.blobs.find_one({"sha256": sha256, "refcount": {"$gt": 0}}) is not None
+
+    if await referenced():
+        return
+    # Move the file aside before deleting it. An upload that took a reference
+    # in the meantime either already saw the file (and is caught by the check
+    # below) or finds the path free and moves its own copy into place.
+    tombstone = path.with_name(f".{path.name}.{uuid.uuid4().hex}.deleting")
     try:
-        # This is a placeholder - you'll need to configure SMTP settings
-        print(f"Password reset email sent to: {email}")
-        print(f"Reset token: {reset_token}")
-        # In a real implementation, send email with reset link
-    except Exception as e:
-        print(f"Failed to send password reset email: {e}")
+        os.replace(path, tombstone)
+    except FileNotFoundError:
+        return
+    if await referenced():
+        # Same bytes either way, so overwriting a fresh copy is harmless
+        os.replace(tombstone, path)
+        return
+    tombstone.unlink(missing_ok=True)
+
+JOB_HANDLERS = {
+    "index_work": run_index_work_job,
+    "unindex_work": run_unindex_work_job,
+    "delete_file": run_delete_file_job,
+}
+job_pool = JobWorkerPool(job_queue, JOB_HANDLERS, JOB_CONCURRENCY)
 
 # Routes
 
@@ -228,7 +1039,7 @@ async def register_user(user_data: UserCreate):
         )
     
     # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await password_hasher.hash(user_data.password)
     user_dict = user_data.dict()
     user_dict["password_hash"] = hashed_password
     del user_dict["password"]
@@ -238,19 +1049,40 @@ async def register_user(user_data: UserCreate):
     user_doc["password_hash"] = hashed_password  # Ensure password_hash is included
     await db.users.insert_one(user_doc)
     
-    # Send notification email to admin
-    send_notification_email(user_dict)
+    # Notify the admins in the next registration digest
+    await outbox.append(
+        "registration_digest",
+        {"full_name": user_dict["full_name"], "email": user_dict["email"]},
+        delay_seconds=OUTBOX_DIGEST_SECONDS,
+    )
     
     return new_user
 
 @api_router.post("/login", response_model=Token) 
-async def login(user_credentials: UserLogin):
+async def login(user_credentials: UserLogin, request: Request, background_tasks: BackgroundTasks):
+    # Refuse bursts before any bcrypt work is queued
+    email_key = f"email:{user_credentials.email.lower()}"
+    client_ip = client_address(request)
+    retry_after = await login_throttle.hit({
+        email_key: LOGIN_THROTTLE_MAX_PER_EMAIL,
+        f"ip:{client_ip}": LOGIN_THROTTLE_MAX_PER_IP
+    })
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, please try again later",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+    
     user = await db.users.find_one({"email": user_credentials.email})
-    if not user or not verify_password(user_credentials.password, user["password_hash"]):
+    if not user:
+        await password_hasher.verify_unknown()
+    if not user or not await password_hasher.verify(user_credentials.password, user["password_hash"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password"
         )
+    await login_throttle.reset(email_key)
     
     if user.get("status", "pending") != "approved":
         if user.get("status", "pending") == "pending":
@@ -264,6 +1096,10 @@ async def login(user_credentials: UserLogin):
                 detail="Account access denied"
             )
     
+    # Roll out hash cost changes without making the member wait for them
+    if pwd_context.needs_update(user["password_hash"]):
+        background_tasks.add_task(rehash_password, user["id"], user_credentials.password, user["password_hash"])
+    
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user["email"]}, expires_delta=access_token_expires
@@ -280,9 +1116,60 @@ async def login(user_credentials: UserLogin):
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": user_data
+        "user": user_data,
+        "refresh_token": await issue_refresh_token(user)
+    }
+
+@api_router.post("/token/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest):
+    """Trade a refresh token for a new access token and a new refresh token"""
+    invalid_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid or expired refresh token"
+    )
+    token_hash = hash_refresh_token(request.refresh_token)
+    now = datetime.now(timezone.utc)
+    # Claim the token atomically so each one can be rotated only once
+    refresh_token_doc = await db.refresh_tokens.find_one_and_update(
+        {"token_hash": token_hash, "rotated_at": None, "expires_at": {"$gt": now}},
+        {"$set": {"rotated_at": now}}
+    )
+    if not refresh_token_doc:
+        # A rotated token coming back means it leaked; end that whole session
+        reused = await db.refresh_tokens.find_one({
+            "token_hash": token_hash,
+            "rotated_at": {"$ne": None, "$lt": now - timedelta(seconds=REFRESH_TOKEN_REUSE_GRACE_SECONDS)}
+        })
+        if reused:
+            await db.refresh_tokens.delete_many({"family_id": reused["family_id"]})
+            logger.warning(f"Refresh token reuse detected for {reused['email']}, session revoked")
+        raise invalid_exception
+    
+    user = await db.users.find_one({"id": refresh_token_doc["user_id"], "status": "approved"})
+    if not user:
+        raise invalid_exception
+    
+    access_token = create_access_token(
+        data={"sub": user["email"]}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "user": {
+            "id": user["id"],
+            "email": user["email"],
+            "full_name": user["full_name"],
+            "level": user["level"],
+            "level_name": LEVELS[user["level"]]
+        },
+        "refresh_token": await issue_refresh_token(user, refresh_token_doc["family_id"])
     }
 
+@api_router.post("/logout")
+async def logout(request: RefreshRequest):
+    await db.refresh_tokens.delete_one({"token_hash": hash_refresh_token(request.refresh_token)})
+    return {"message": "Logged out successfully"}
+
 @api_router.post("/forgot-password")
 async def forgot_password(request: PasswordResetRequest):
     # Check if user exists
@@ -291,33 +1178,40 @@ async def forgot_password(request: PasswordResetRequest):
         # Don't reveal if email exists or not for security
         return {"message": "If your email is registered, you will receive a password reset link."}
     
-    # Generate reset token
-    reset_token = generate_reset_token()
-    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)  # Token expires in 1 hour
-    
-    # Save reset token to database
-    reset_token_doc = PasswordResetToken(
-        email=request.email,
-        token=reset_token,
-        expires_at=expires_at
-    )
+    # Send the live token again if there is one, so repeated requests don't pile up tokens
+    now = datetime.now(timezone.utc)
+    reset_token_doc = await db.password_reset_tokens.find_one({
+        "email": request.email,
+        "used": False,
+        "expires_at": {"$gt": now + RESET_TOKEN_REUSE_MIN_REMAINING}
+    })
     
-    await db.password_reset_tokens.insert_one(reset_token_doc.dict())
+    if reset_token_doc:
+        nonce = reset_token_doc["nonce"]
+    else:
+        # Expired tokens are removed by the TTL index on expires_at
+        nonce = secrets.token_hex(16)
+        reset_token = derive_reset_token(request.email, nonce)
+        new_token_doc = PasswordResetToken(
+            email=request.email,
+            nonce=nonce,
+            token_hash=hash_reset_token(reset_token),
+            expires_at=now + RESET_TOKEN_TTL
+        )
+        await db.password_reset_tokens.insert_one(new_token_doc.dict())
     
     # Send reset email
-    send_password_reset_email(request.email, reset_token)
+    await outbox.append("password_reset", {"email": request.email, "nonce": nonce})
     
     return {"message": "If your email is registered, you will receive a password reset link."}
 
 @api_router.post("/reset-password")
 async def reset_password(request: PasswordReset):
-    # Find valid reset token
-    reset_token_doc = await db.password_reset_tokens.find_one({
-        "email": request.email,
-        "token": request.reset_token,
-        "used": False,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
-    })
+    # Claim the token atomically so it can only be used once
+    reset_token_doc = await db.password_reset_tokens.find_one_and_update(
+        live_reset_token_filter(request.email, request.reset_token),
+        {"$set": {"used": True}}
+    )
     
     if not reset_token_doc:
         raise HTTPException(
@@ -326,29 +1220,23 @@ async def reset_password(request: PasswordReset):
         )
     
     # Update user password
-    new_password_hash = get_password_hash(request.new_password)
+    new_password_hash = await password_hasher.hash(request.new_password)
     await db.users.update_one(
         {"email": request.email},
         {"$set": {"password_hash": new_password_hash}}
     )
+    principal_cache.invalidate(email=request.email)
+    await revoke_refresh_tokens(email=request.email)
     
-    # Mark token as used
-    await db.password_reset_tokens.update_one(
-        {"id": reset_token_doc["id"]},
-        {"$set": {"used": True}}
-    )
+    # Any other outstanding token for this email is void now
+    await db.password_reset_tokens.delete_many({"email": request.email})
     
     return {"message": "Password reset successfully"}
 
 @api_router.get("/verify-reset-token/{email}/{token}")
 async def verify_reset_token(email: str, token: str):
     # Check if token is valid
-    reset_token_doc = await db.password_reset_tokens.find_one({
-        "email": email,
-        "token": token,
-        "used": False,
-        "expires_at": {"$gt": datetime.now(timezone.utc)}
-    })
+    reset_token_doc = await db.password_reset_tokens.find_one(live_reset_token_filter(email, token))
     
     if not reset_token_doc:
         raise HTTPException(
@@ -380,55 +1268,14 @@ async def update_current_user(update_data: UserUpdate, current_user = Depends(ge
     # Update password if both current and new passwords are provided
     if update_data.current_password and update_data.new_password:
         # Verify current password
-        if not verify_password(update_data.current_password, current_user["password_hash"]):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Current password is incorrect"
-            )
-        
-        # Set new password
-        update_fields["password_hash"] = get_password_hash(update_data.new_password)
-    
-    if not update_fields:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="No fields to update"
-        )
-    
-    # Update user in database
-    result = await db.users.update_one(
-        {"id": current_user["id"]},
-        {"$set": update_fields}
-    )
-    
-    if result.modified_count == 0:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    return {"message": "Profile updated successfully"}
-
-@api_router.put("/me")
-async def update_current_user(update_data: UserUpdate, current_user = Depends(get_current_user)):
-    """Allow users to update their own profile"""
-    update_fields = {}
-    
-    # Update full name if provided
-    if update_data.full_name:
-        update_fields["full_name"] = update_data.full_name
-    
-    # Update password if both current and new passwords are provided
-    if update_data.current_password and update_data.new_password:
-        # Verify current password
-        if not verify_password(update_data.current_password, current_user["password_hash"]):
+        if not await password_hasher.verify(update_data.current_password, current_user["password_hash"]):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Current password is incorrect"
             )
         
         # Set new password
-        update_fields["password_hash"] = get_password_hash(update_data.new_password)
+        update_fields["password_hash"] = await password_hasher.hash(update_data.new_password)
     
     if not update_fields:
         raise HTTPException(
@@ -441,6 +1288,9 @@ async def update_current_user(update_data: UserUpdate, current_user = Depends(ge
         {"id": current_user["id"]},
         {"$set": update_fields}
     )
+    principal_cache.invalidate(email=current_user["email"])
+    if "password_hash" in update_fields:
+        await revoke_refresh_tokens(user_id=current_user["id"])
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -451,19 +1301,28 @@ async def update_current_user(update_data: UserUpdate, current_user = Depends(ge
     return {"message": "Profile updated successfully"}
 
 # Admin routes
-@api_router.get("/admin/pending-users", response_model=List[PendingApproval])
-async def get_pending_users(admin_user = Depends(get_admin_user)):
-    pending_users = await db.users.find({"status": "pending"}).to_list(1000)
-    return [
-        PendingApproval(
-            id=user["id"],
-            email=user["email"],
-            full_name=user["full_name"],
-            level=user["level"],
-            level_name=LEVELS[user["level"]],
-            created_at=user["created_at"]
-        ) for user in pending_users
-    ]
+@api_router.get("/admin/pending-users", response_model=PendingApprovalPage)
+async def get_pending_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    admin_user = Depends(get_admin_user)
+):
+    pending_users, next_cursor = await fetch_page(
+        db.users, {"status": "pending"}, "created_at", cursor, limit, USER_LIST_PROJECTION
+    )
+    return ORJSONResponse({
+        "items": [
+            {
+                "id": user["id"],
+                "email": user["email"],
+                "full_name": user["full_name"],
+                "level": user["level"],
+                "level_name": LEVELS[user["level"]],
+                "created_at": user["created_at"]
+            } for user in pending_users
+        ],
+        "next_cursor": next_cursor
+    })
 
 @api_router.post("/admin/approve-user/{user_id}")
 async def approve_user(user_id: str, admin_user = Depends(get_admin_user)):
@@ -477,6 +1336,7 @@ async def approve_user(user_id: str, admin_user = Depends(get_admin_user)):
             }
         }
     )
+    principal_cache.invalidate(user_id=user_id)
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -492,6 +1352,8 @@ async def reject_user(user_id: str, admin_user = Depends(get_admin_user)):
         {"id": user_id},
         {"$set": {"status": "rejected"}}
     )
+    principal_cache.invalidate(user_id=user_id)
+    await revoke_refresh_tokens(user_id=user_id)
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -502,46 +1364,64 @@ async def reject_user(user_id: str, admin_user = Depends(get_admin_user)):
     return {"message": "User rejected successfully"}
 
 @api_router.get("/admin/all-users")
-async def get_all_users(admin_user = Depends(get_admin_user)):
-    users = await db.users.find({}).to_list(1000)
-    return [
-        {
-            "id": user["id"],
-            "email": user["email"],
-            "full_name": user["full_name"],
-            "level": user["level"],
-            "level_name": LEVELS[user["level"]],
-            "status": user.get("status", "pending"),
-            "created_at": user["created_at"]
-        } for user in users
-    ]
+async def get_all_users(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    admin_user = Depends(get_admin_user)
+):
+    users, next_cursor = await fetch_page(db.users, {}, "created_at", cursor, limit, USER_LIST_PROJECTION)
+    return ORJSONResponse({
+        "items": [
+            {
+                "id": user["id"],
+                "email": user["email"],
+                "full_name": user["full_name"],
+                "level": user["level"],
+                "level_name": LEVELS[user["level"]],
+                "status": user.get("status", "pending"),
+                "created_at": user["created_at"]
+            } for user in users
+        ],
+        "next_cursor": next_cursor
+    })
 
 @api_router.get("/super-admin/all-users-with-passwords")
-async def get_all_users_with_passwords(super_admin_user = Depends(get_super_admin_user)):
+async def get_all_users_with_passwords(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    super_admin_user = Depends(get_super_admin_user)
+):
     """Super admin can view all users with their password hashes"""
-    users = await db.users.find({}).to_list(1000)
-    return [
-        {
-            "id": user["id"],
-            "email": user["email"],
-            "full_name": user["full_name"],
-            "level": user["level"],
-            "level_name": LEVELS[user["level"]],
-            "status": user.get("status", "pending"),
-            "created_at": user.get("created_at", ""),
-            "password_hash": user.get("password_hash", "")
-        } for user in users
-    ]
+    users, next_cursor = await fetch_page(
+        db.users, {}, "created_at", cursor, limit, {**USER_LIST_PROJECTION, "password_hash": 1}
+    )
+    return ORJSONResponse({
+        "items": [
+            {
+                "id": user["id"],
+                "email": user["email"],
+                "full_name": user["full_name"],
+                "level": user["level"],
+                "level_name": LEVELS[user["level"]],
+                "status": user.get("status", "pending"),
+                "created_at": user.get("created_at", ""),
+                "password_hash": user.get("password_hash", "")
+            } for user in users
+        ],
+        "next_cursor": next_cursor
+    })
 
 @api_router.put("/super-admin/reset-user-password/{user_id}")
 async def reset_user_password(user_id: str, new_password: str, super_admin_user = Depends(get_super_admin_user)):
     """Super admin can reset any user's password"""
-    new_password_hash = get_password_hash(new_password)
+    new_password_hash = await password_hasher.hash(new_password)
     
     result = await db.users.update_one(
         {"id": user_id},
         {"$set": {"password_hash": new_password_hash}}
     )
+    principal_cache.invalidate(user_id=user_id)
+    await revoke_refresh_tokens(user_id=user_id)
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -583,6 +1463,7 @@ async def change_user_level(user_id: str, new_level: int, admin_user = Depends(g
         {"id": user_id},
         {"$set": {"level": new_level}}
     )
+    principal_cache.invalidate(user_id=user_id)
     
     if result.modified_count == 0:
         raise HTTPException(
@@ -599,6 +1480,8 @@ async def change_user_level(user_id: str, new_level: int, admin_user = Depends(g
 @api_router.delete("/admin/delete-user/{user_id}")
 async def delete_user(user_id: str, admin_user = Depends(get_admin_user)):
     result = await db.users.delete_one({"id": user_id})
+    principal_cache.invalidate(user_id=user_id)
+    await revoke_refresh_tokens(user_id=user_id)
     if result.deleted_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -606,6 +1489,78 @@ async def delete_user(user_id: str, admin_user = Depends(get_admin_user)):
         )
     return {"message": "User deleted successfully"}
 
+@api_router.post("/admin/users/bulk")
+async def bulk_user_admin(request: BulkUserRequest, current_user = Depends(get_current_user)):
+    """Approve, reject, delete or change the level of many users in one unordered bulk write.
+
+    Each operation gets its own result; one failing does not stop the others.
+    """
+    # Same rules as the single-user routes, checked once for the whole batch
+    actions = {operation.action for operation in request.operations}
+    if actions & {"approve", "reject", "delete"}:
+        await get_admin_user(current_user)
+    if "change_level" in actions:
+        await get_super_admin_or_master_user(current_user)
+
+    user_ids = list({operation.user_id for operation in request.operations})
+    existing = {
+        user["id"] for user in await db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1}).to_list(None)
+    }
+
+    now = datetime.now(timezone.utc)
+    results, writes, written = [], [], []
+    seen = set()
+    for index, operation in enumerate(request.operations):
+        result = {"index": index, "user_id": operation.user_id, "action": operation.action, "ok": False, "error": None}
+        results.append(result)
+        # Unordered writes to the same user would apply in any order
+        if operation.user_id in seen:
+            result["error"] = "Duplicate operation for this user"
+        elif operation.user_id not in existing:
+            result["error"] = "User not found"
+        elif operation.action == "change_level" and operation.new_level not in LEVELS:
+            result["error"] = "Invalid level. Must be 1 (aprendiz), 2 (companheiro), or 3 (mestre)"
+        elif (operation.action == "change_level" and operation.user_id == current_user["id"] and
+              current_user["email"] not in SUPER_ADMIN_EMAILS):
+            result["error"] = "Masters cannot change their own level"
+        seen.add(operation.user_id)
+        if result["error"]:
+            continue
+
+        user_filter = {"id": operation.user_id}
+        if operation.action == "approve":
+            writes.append(UpdateOne(user_filter, {"$set": {
+                "status": "approved", "approved_at": now, "approved_by": current_user["email"]
+            }}))
+        elif operation.action == "reject":
+            writes.append(UpdateOne(user_filter, {"$set": {"status": "rejected"}}))
+        elif operation.action == "change_level":
+            writes.append(UpdateOne(user_filter, {"$set": {"level": operation.new_level}}))
+        else:
+            writes.append(DeleteOne(user_filter))
+        written.append(result)
+
+    write_errors = {}
+    if writes:
+        try:
+            await db.users.bulk_write(writes, ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error.get("errmsg", "Write failed") for error in e.details["writeErrors"]}
+
+    signed_out = []
+    for position, result in enumerate(written):
+        principal_cache.invalidate(user_id=result["user_id"])
+        if position in write_errors:
+            result["error"] = write_errors[position]
+            continue
+        result["ok"] = True
+        if result["action"] in ("reject", "delete"):
+            signed_out.append(result["user_id"])
+    await revoke_refresh_tokens(user_ids=signed_out)
+
+    succeeded = sum(1 for result in results if result["ok"])
+    return ORJSONResponse({"results": results, "succeeded": succeeded, "failed": len(results) - succeeded})
+
 # Work files routes
 @api_router.post("/upload-work/{level}")
 async def upload_work(
@@ -628,26 +1583,15 @@ async def upload_work(
             detail="You don't have permission to upload to this level"
         )
     
-    # Validate file type
-    if not file.filename.endswith('.pdf'):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only PDF files are allowed"
-        )
-    
     # Create uploads directory if it doesn't exist
-    upload_dir = Path("/app/backend/uploads")
-    upload_dir.mkdir(exist_ok=True)
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Save file
-    file_id = str(uuid.uuid4())
-    file_extension = Path(file.filename).suffix
-    filename = f"{file_id}{file_extension}"
-    file_path = upload_dir / filename
+    # Stage the file; the content itself is checked for the PDF signature
+    staged_path = UPLOAD_DIR / f".{uuid.uuid4()}.pdf"
+    size, sha256 = await save_upload(file, staged_path)
     
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    # Identical PDFs share one blob on disk
+    file_path = await store_blob(staged_path, sha256, size)
     
     # Save file info to database
     work_file = WorkFile(
@@ -656,15 +1600,216 @@ async def upload_work(
         file_path=str(file_path),
         level=level,
         uploaded_by=current_user["id"],
-        uploaded_by_name=current_user["full_name"]
+        uploaded_by_name=current_user["full_name"],
+        size=size,
+        sha256=sha256
     )
     
-    await db.work_files.insert_one(work_file.dict())
+    try:
+        await db.work_files.insert_one(work_file.dict())
+    except BaseException:
+        await release_blob(sha256)
+        raise
+    await job_queue.enqueue("index_work", {"work_id": work_file.id, "level": level, "file_path": str(file_path)})
     
     return {"message": "File uploaded successfully", "file_id": work_file.id}
 
-@api_router.get("/works/{level}", response_model=List[WorkFile])
-async def get_works_by_level(level: int, current_user = Depends(get_current_user)):
+@api_router.post("/upload-work/{level}/preflight")
+async def upload_work_preflight(
+    level: int,
+    title: str,
+    preflight: UploadPreflight,
+    current_user = Depends(get_current_user)
+):
+    """Create the work from an already stored blob so the client can skip sending the bytes"""
+    if level < 1 or level > 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid level"
+        )
+    
+    if current_user["level"] < level:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to upload to this level"
+        )
+    
+    # A hash is no proof of holding the bytes (it leaks through checksums and
+    # ETags), so only reuse content the member can already read or uploaded
+    readable = await db.work_files.find_one(
+        {
+            "sha256": preflight.sha256,
+            "$or": [{"level": {"$lte": current_user["level"]}}, {"uploaded_by": current_user["id"]}]
+        },
+        {"_id": 1}
+    )
+    blob = await acquire_blob(preflight.sha256) if readable else None
+    if not blob:
+        # Client has to upload the file through /upload-work
+        return {"uploaded": False}
+    
+    work_file = WorkFile(
+        title=title,
+        filename=preflight.filename,
+        file_path=blob["path"],
+        level=level,
+        uploaded_by=current_user["id"],
+        uploaded_by_name=current_user["full_name"],
+        size=blob["size"],
+        sha256=preflight.sha256
+    )
+    
+    try:
+        await db.work_files.insert_one(work_file.dict())
+    except BaseException:
+        await release_blob(preflight.sha256)
+        raise
+    await job_queue.enqueue("index_work", {"work_id": work_file.id, "level": level, "file_path": blob["path"]})
+    
+    return {"uploaded": True, "message": "File uploaded successfully", "file_id": work_file.id}
+
+@api_router.post("/upload-works/{level}")
+async def upload_works(
+    level: int,
+    files: List[UploadFile] = File(...),
+    current_user = Depends(get_current_user)
+):
+    """Upload many PDFs at once, sent as separate files, ZIP archives of PDFs, or both.
+
+    Every PDF becomes a work titled after its file name. The response holds
+    one result per PDF or archive entry, in upload order, so the failed ones
+    can be sent again.
+    """
+    if level < 1 or level > 3:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid level"
+        )
+    
+    if current_user["level"] < level:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to upload to this level"
+        )
+    
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    results, stages, archives = [], [], []
+    
+    def add_entry(name: str, stage):
+        results.append({"index": len(results), "name": name, "ok": False, "file_id": None, "error": None})
+        stages.append(stage)
+    
+    try:
+        for upload in files:
+            # The multipart parser spooled each file to disk, so archives are read in place
+            is_archive = await upload.read(len(ZIP_MAGIC)) == ZIP_MAGIC
+            await upload.seek(0)
+            if not is_archive:
+                add_entry(upload.filename, lambda destination, upload=upload: save_upload(upload, destination))
+                continue
+            try:
+                archive = await loop.run_in_executor(None, zipfile.ZipFile, upload.file)
+            except zipfile.BadZipFile:
+                add_entry(upload.filename, None)
+                results[-1]["error"] = "Invalid ZIP archive"
+                continue
+            archives.append(archive)
+            for info in archive.infolist():
+                # Skip folders and the metadata macOS adds to archives
+                if info.is_dir() or info.filename.startswith("__MACOSX/") or Path(info.filename).name.startswith("."):
+                    continue
+                add_entry(
+                    f"{upload.filename}/{info.filename}",
+                    lambda destination, archive=archive, info=info:
+                        loop.run_in_executor(None, stage_archive_entry, archive, info, destination)
+                )
+        
+        if len(results) > BULK_UPLOAD_MAX_ENTRIES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {BULK_UPLOAD_MAX_ENTRIES} files per upload"
+            )
+        
+        semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+        
+        async def ingest(result: dict, stage) -> Optional[WorkFile]:
+            if stage is None:
+                return None
+            async with semaphore:
+                staged_path = UPLOAD_DIR / f".{uuid.uuid4()}.pdf"
+                try:
+                    size, sha256 = await stage(staged_path)
+                    file_path = await store_blob(staged_path, sha256, size)
+                except HTTPException as e:
+                    result["error"] = e.detail
+                    return None
+                except (zipfile.BadZipFile, zipfile.LargeZipFile, zlib.error, NotImplementedError, RuntimeError) as e:
+                    # Corrupt, encrypted or unsupported compression
+                    result["error"] = f"Could not read archive entry: {e}"
+                    return None
+                except Exception as e:
+                    # Fail this entry only; store_blob has given back any reference it took
+                    logging.getLogger(__name__).warning(f"Bulk upload of {result['name']} failed: {e}")
+                    staged_path.unlink(missing_ok=True)
+                    result["error"] = f"Could not store file: {e}"
+                    return None
+            filename = Path(result["name"]).name
+            return WorkFile(
+                title=Path(filename).stem,
+                filename=filename,
+                file_path=str(file_path),
+                level=level,
+                uploaded_by=current_user["id"],
+                uploaded_by_name=current_user["full_name"],
+                size=size,
+                sha256=sha256
+            )
+        
+        work_files = await asyncio.gather(*(ingest(result, stage) for result, stage in zip(results, stages)))
+    finally:
+        for archive in archives:
+            archive.close()
+    
+    created = [(result, work_file) for result, work_file in zip(results, work_files) if work_file is not None]
+    write_errors = {}
+    if created:
+        try:
+            await db.work_files.insert_many([work_file.dict() for _, work_file in created], ordered=False)
+        except BulkWriteError as e:
+            write_errors = {error["index"]: error.get("errmsg", "Write failed") for error in e.details["writeErrors"]}
+        except Exception as e:
+            # Part of the batch may have been written before the error
+            ids = [work_file.id for _, work_file in created]
+            inserted = {
+                doc["id"] for doc in await db.work_files.find({"id": {"$in": ids}}, {"_id": 0, "id": 1}).to_list(None)
+            }
+            write_errors = {
+                position: f"Could not save work: {e}"
+                for position, (_, work_file) in enumerate(created) if work_file.id not in inserted
+            }
+    
+    jobs = []
+    for position, (result, work_file) in enumerate(created):
+        if position in write_errors:
+            result["error"] = write_errors[position]
+            await release_blob(work_file.sha256)
+            continue
+        result["ok"] = True
+        result["file_id"] = work_file.id
+        jobs.append(new_job("index_work", {"work_id": work_file.id, "level": level, "file_path": work_file.file_path}))
+    await job_queue.enqueue_many(jobs)
+    
+    succeeded = sum(1 for result in results if result["ok"])
+    return ORJSONResponse({"results": results, "succeeded": succeeded, "failed": len(results) - succeeded})
+
+@api_router.get("/works/{level}", response_model=WorkFilePage)
+async def get_works_by_level(
+    level: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    current_user = Depends(get_current_user)
+):
     # Check access permissions based on hierarchy
     if current_user["level"] < level:
         raise HTTPException(
@@ -672,67 +1817,120 @@ async def get_works_by_level(level: int, current_user = Depends(get_current_user
             detail="You don't have permission to view this level"
         )
     
-    works = await db.work_files.find({"level": level}).to_list(1000)
-    return [WorkFile(**work) for work in works]
+    works, next_cursor = await fetch_page(db.work_files, {"level": level}, "uploaded_at", cursor, limit, WORK_PROJECTION)
+    return ORJSONResponse({"items": works, "next_cursor": next_cursor})
 
 @api_router.get("/works")
-async def get_accessible_works(current_user = Depends(get_current_user)):
-    """Get all works that the current user can access based on their level"""
+async def get_accessible_works(
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    current_user = Depends(get_current_user)
+):
+    """Get the first works of every level the current user can access, with per-level totals.
+
+    Each level carries at most `limit` works; its next_cursor continues
+    the listing through /works/{level}.
+    """
     user_level = current_user["level"]
     
     # Users can access their level and all levels below
     accessible_levels = list(range(1, user_level + 1))
     
-    works = await db.work_files.find({"level": {"$in": accessible_levels}}).to_list(1000)
+    # One indexed query per level for the first page and one for its total, all
+    # at once; each is served by the (level, uploaded_at, id) index
+    pages, counts = await asyncio.gather(
+        asyncio.gather(*(
+            fetch_page(db.work_files, {"level": level}, "uploaded_at", None, limit, WORK_PROJECTION)
+            for level in accessible_levels
+        )),
+        asyncio.gather(*(db.work_files.count_documents({"level": level}) for level in accessible_levels))
+    )
     
-    # Group works by level
     works_by_level = {}
-    for work in works:
-        level = work["level"]
+    totals = {}
+    next_cursors = {}
+    for level, (works, next_cursor), count in zip(accessible_levels, pages, counts):
         level_name = LEVELS[level]
-        if level_name not in works_by_level:
-            works_by_level[level_name] = []
-        works_by_level[level_name].append(WorkFile(**work))
+        works_by_level[level_name] = works
+        totals[level_name] = count
+        next_cursors[level_name] = next_cursor
     
-    return works_by_level
+    return ORJSONResponse({"works": works_by_level, "totals": totals, "next_cursors": next_cursors})
+
+@api_router.get("/search")
+async def search_works(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    current_user = Depends(get_current_user)
+):
+    """Works the current user can access whose text best matches q, with the best matching page"""
+    loop = asyncio.get_running_loop()
+    hits = await loop.run_in_executor(None, search_index.search, q, current_user["level"], limit)
+    
+    # The index may lag behind deletions in other workers; only return works that still exist
+    works = await db.work_files.find(
+        {"id": {"$in": [hit["work_id"] for hit in hits]}, "level": {"$lte": current_user["level"]}},
+        WORK_PROJECTION
+    ).to_list(len(hits))
+    works_by_id = {work["id"]: work for work in works}
+    return ORJSONResponse({
+        "items": [
+            {**works_by_id[hit["work_id"]], "score": hit["score"], "page": hit["page"]}
+            for hit in hits if hit["work_id"] in works_by_id
+        ]
+    })
 
 @api_router.get("/users-with-works")
-async def get_users_with_works(page: int = 1, limit: int = 20, current_user = Depends(get_current_user)):
+async def get_users_with_works(
+    page: int = Query(1, ge=1),
+    limit: int = Query(20, ge=1, le=100),
+    current_user = Depends(get_current_user)
+):
     """Get users with their works based on access level hierarchy"""
     user_level = current_user["level"]
     
     # Users can access users of their level and all levels below
     accessible_levels = list(range(1, user_level + 1))
-    
-    # Get users with approved status and accessible levels
-    users = await db.users.find({
+    users_filter = {
         "status": "approved", 
         "level": {"$in": accessible_levels}
-    }).to_list(1000)
+    }
     
-    # Calculate pagination
+    # Page through users and join their works in a single round trip
     skip = (page - 1) * limit
-    total_users = len(users)
-    paginated_users = users[skip:skip + limit]
-    
-    users_with_works = []
+    pipeline = [
+        {"$match": users_filter},
+        {"$sort": {"created_at": 1, "id": 1}},
+        {"$skip": skip},
+        {"$limit": limit},
+        {"$lookup": {
+            "from": "work_files",
+            "localField": "id",
+            "foreignField": "uploaded_by",
+            "as": "works"
+        }},
+        {"$project": {
+            "_id": 0, "id": 1, "full_name": 1, "email": 1, "level": 1,
+            **{f"works.{field_name}": 1 for field_name in WorkFile.model_fields}
+        }}
+    ]
+    total_users, paginated_users = await asyncio.gather(
+        db.users.count_documents(users_filter),
+        db.users.aggregate(pipeline).to_list(limit)
+    )
     
-    for user in paginated_users:
-        # Get works for this user
-        user_works = await db.work_files.find({"uploaded_by": user["id"]}).to_list(1000)
-        
-        user_data = {
+    users_with_works = [
+        {
             "id": user["id"],
             "full_name": user["full_name"],
             "email": user["email"],
             "level": user["level"],
             "level_name": LEVELS[user["level"]],
-            "works_count": len(user_works),
-            "works": [WorkFile(**work) for work in user_works]
-        }
-        users_with_works.append(user_data)
+            "works_count": len(user["works"]),
+            "works": user["works"]
+        } for user in paginated_users
+    ]
     
-    return {
+    return ORJSONResponse({
         "users": users_with_works,
         "pagination": {
             "current_page": page,
@@ -740,10 +1938,181 @@ async def get_users_with_works(page: int = 1, limit: int = 20, current_user = De
             "total_users": total_users,
             "limit": limit
         }
+    })
+
+def file_etag(work: dict, stat_result: os.stat_result) -> str:
+    """Strong validator for a stored work file"""
+    if work.get("sha256"):
+        return f'"{work["sha256"]}"'
+    return f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def etag_matches(header_value: str, etag: str) -> bool:
+    """Weak comparison as used by If-None-Match"""
+    if header_value.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header_value.split(","))
+
+def parse_byte_ranges(header_value: str, size: int):
+    """Parse a Range header into inclusive (start, end) pairs.
+
+    Returns None when the header should be ignored and the whole file
+    served, and an empty list when none of the ranges is satisfiable.
+    """
+    unit, _, spec = header_value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    
+    ranges = []
+    for part in spec.split(","):
+        start_text, separator, end_text = part.strip().partition("-")
+        if not separator:
+            return None
+        try:
+            if not start_text:
+                # Suffix range: the last N bytes
+                length = int(end_text)
+                start, end = max(0, size - length), size - 1
+                if length <= 0:
+                    continue
+            else:
+                start = int(start_text)
+                end = min(int(end_text), size - 1) if end_text else size - 1
+                if start < 0 or (end_text and int(end_text) < start):
+                    return None
+        except ValueError:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, end))
+    
+    if len(ranges) > MAX_BYTE_RANGES:
+        return None
+    return ranges
+
+async def iter_file_range(path: Path, start: int, end: int):
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(FILE_STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def offload_file_response(file_path: Path, headers: dict) -> Optional[Response]:
+    """Ask the reverse proxy to send the file, or None when it cannot reach it"""
+    if FILE_DELIVERY_MODE == "x-sendfile":
+        return Response(media_type="application/pdf", headers={**headers, "X-Sendfile": str(file_path.resolve())})
+    
+    # nginx maps the internal location onto UPLOAD_DIR
+    try:
+        relative_path = file_path.resolve().relative_to(UPLOAD_DIR.resolve())
+    except ValueError:
+        return None
+    internal_uri = FILE_DELIVERY_INTERNAL_PREFIX.rstrip("/") + "/" + quote(relative_path.as_posix())
+    return Response(media_type="application/pdf", headers={**headers, "X-Accel-Redirect": internal_uri})
+
+def work_file_response(request: Request, work: dict, disposition: str):
+    """Serve a work PDF with ETag revalidation and single or multi-range requests"""
+    file_path = Path(work["file_path"])
+    try:
+        stat_result = file_path.stat()
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="File not found on disk"
+        )
+    
+    # Sanitize filename for Content-Disposition header
+    safe_filename = work['filename'].encode('ascii', errors='ignore').decode('ascii')
+    if not safe_filename:
+        safe_filename = "document.pdf"
+    
+    size = stat_result.st_size
+    etag = file_etag(work, stat_result)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": FILE_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f"{disposition}; filename={safe_filename}"
     }
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag, "Cache-Control": FILE_CACHE_CONTROL}
+        )
+    
+    # The proxy handles ranges itself once it has the file
+    if FILE_DELIVERY_MODE != "app":
+        offloaded = offload_file_response(file_path, headers)
+        if offloaded is not None:
+            return offloaded
+    
+    # A stale If-Range validator means the client gets the whole file
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    ranges = None
+    if range_header and (if_range is None or if_range.strip() == etag):
+        ranges = parse_byte_ranges(range_header, size)
+    
+    if ranges is None:
+        return FileResponse(
+            path=file_path,
+            media_type="application/pdf",
+            headers=headers,
+            stat_result=stat_result
+        )
+    
+    if not ranges:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={**headers, "Content-Range": f"bytes */{size}"}
+        )
+    
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return StreamingResponse(
+            iter_file_range(file_path, start, end),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type="application/pdf",
+            headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end}/{size}",
+                "Content-Length": str(end - start + 1)
+            }
+        )
+    
+    boundary = secrets.token_hex(16)
+    parts = [
+        (
+            f"--{boundary}\r\nContent-Type: application/pdf\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode()
+        for start, end in ranges
+    ]
+    closing = f"--{boundary}--\r\n".encode()
+    content_length = sum(len(part) + end - start + 1 + 2 for part, (start, end) in zip(parts, ranges)) + len(closing)
+    
+    async def multipart_body():
+        for part, (start, end) in zip(parts, ranges):
+            yield part
+            async for chunk in iter_file_range(file_path, start, end):
+                yield chunk
+            yield b"\r\n"
+        yield closing
+    
+    return StreamingResponse(
+        multipart_body(),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers={**headers, "Content-Length": str(content_length)}
+    )
 
 @api_router.get("/work-file/{work_id}")
-async def view_work_file(work_id: str, current_user = Depends(get_current_user)):
+async def view_work_file(work_id: str, request: Request, current_user = Depends(get_current_user)):
     """Serve PDF file for viewing in browser"""
     work = await db.work_files.find_one({"id": work_id})
     if not work:
@@ -759,28 +2128,31 @@ async def view_work_file(work_id: str, current_user = Depends(get_current_user))
             detail="You don't have permission to view this file"
         )
     
-    file_path = Path(work["file_path"])
-    if not file_path.exists():
+    return work_file_response(request, work, "inline")
+
+@api_router.get("/download-work/{work_id}")
+async def download_work_file(work_id: str, request: Request, current_user = Depends(get_current_user)):
+    """Download PDF file"""
+    work = await db.work_files.find_one({"id": work_id})
+    if not work:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found on disk"
+            detail="Work file not found"
         )
     
-    # Sanitize filename for Content-Disposition header
-    safe_filename = work['filename'].encode('ascii', errors='ignore').decode('ascii')
-    if not safe_filename:
-        safe_filename = "document.pdf"
+    # Check access permissions based on hierarchy
+    if current_user["level"] < work["level"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to download this file"
+        )
     
-    return FileResponse(
-        path=file_path,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"inline; filename={safe_filename}"}
-    )
+    return work_file_response(request, work, "attachment")
 
-@api_router.get("/download-work/{work_id}")
-async def download_work_file(work_id: str, current_user = Depends(get_current_user)):
-    """Download PDF file"""
-    work = await db.work_files.find_one({"id": work_id})
+@api_router.post("/download-work/{work_id}/link")
+async def create_work_download_link(work_id: str, current_user = Depends(get_current_user)):
+    """Issue a signed, expiring download URL after the usual permission check"""
+    work = await db.work_files.find_one({"id": work_id}, {"_id": 0, "level": 1})
     if not work:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -794,24 +2166,26 @@ async def download_work_file(work_id: str, current_user = Depends(get_current_us
             detail="You don't have permission to download this file"
         )
     
-    file_path = Path(work["file_path"])
-    if not file_path.exists():
+    return create_download_url(work_id)
+
+@api_router.get("/signed-download/{work_id}")
+async def signed_download_work_file(work_id: str, expires: int, signature: str, request: Request):
+    """Download PDF file through a URL issued by create_work_download_link"""
+    if (expires < time.time() or
+        not hmac.compare_digest(signature, sign_download(work_id, expires))):
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File not found on disk"
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Download link is invalid or has expired"
         )
     
-    # Sanitize filename for Content-Disposition header
-    safe_filename = work['filename'].encode('ascii', errors='ignore').decode('ascii')
-    if not safe_filename:
-        safe_filename = "document.pdf"
+    work = await db.work_files.find_one({"id": work_id})
+    if not work:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Work file not found"
+        )
     
-    return FileResponse(
-        path=file_path,
-        media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={safe_filename}"},
-        filename=safe_filename
-    )
+    return work_file_response(request, work, "attachment")
 
 @api_router.delete("/delete-work/{work_id}")
 async def delete_work(work_id: str, current_user = Depends(get_admin_or_master_user)):
@@ -823,16 +2197,19 @@ async def delete_work(work_id: str, current_user = Depends(get_admin_or_master_u
             detail="Work file not found"
         )
     
-    # Delete file from filesystem
-    try:
-        file_path = Path(work["file_path"])
-        if file_path.exists():
-            file_path.unlink()
-    except Exception as e:
-        print(f"Error deleting file: {e}")
-    
     # Delete from database
-    await db.work_files.delete_one({"id": work_id})
+    result = await db.work_files.delete_one({"id": work_id})
+    if result.deleted_count == 0:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Work file not found"
+        )
+    
+    await job_queue.enqueue("unindex_work", {"work_id": work_id})
+    
+    # Delete file from filesystem once no other work shares it
+    if not (work.get("sha256") and await release_blob(work["sha256"])):
+        await job_queue.enqueue("delete_file", {"path": work["file_path"]})
     
     return {"message": "Work file deleted successfully"}
 
@@ -848,6 +2225,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=COMPRESSION_MINIMUM_SIZE,
+    cached_routes=COMPRESSION_CACHED_ROUTES,
+    cache_max_bytes=COMPRESSION_CACHE_MAX_BYTES,
+)
+
+# Outermost, so it times everything including CORS handling and compression
+app.add_middleware(MetricsMiddleware)
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus scrape endpoint"""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -855,6 +2248,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    app.state.event_loop_monitor = asyncio.create_task(monitor_event_loop_lag())
+
+@app.on_event("startup")
+async def ensure_indexes():
+    # Build in the background so a large collection doesn't hold up startup
+    app.state.index_build = asyncio.create_task(apply_indexes(db))
+
+@app.on_event("startup")
+async def configure_password_policy():
+    if PASSWORD_HASH_ROUNDS:
+        rounds = int(PASSWORD_HASH_ROUNDS)
+    elif PASSWORD_HASH_TARGET_MS:
+        loop = asyncio.get_running_loop()
+        rounds = await loop.run_in_executor(None, calibrate_bcrypt_rounds, float(PASSWORD_HASH_TARGET_MS))
+    else:
+        return
+    apply_password_policy(rounds)
+    logger.info(f"Password hashing policy: bcrypt with {rounds} rounds")
+
+@app.on_event("startup")
+async def start_job_workers():
+    if JOB_WORKER_MODE == "in-process":
+        await job_pool.start()
+        await outbox_sender.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    app.state.event_loop_monitor.cancel()
+    # Index builds may still be running against a large collection
+    app.state.index_build.cancel()
+    await job_pool.stop()
+    await outbox_sender.stop()
+    client.close()
+    password_hasher.shutdown()
+    if search_ingest_executor is not None:
+        search_ingest_executor.shutdown(wait=False, cancel_futures=True)
\ No newline at end of file
@@ -0,0 +1,39 @@
+"""Run background jobs and send outgoing email in their own process.
+
+Use together with JOB_WORKER_MODE=external so the web workers only enqueue:
+
+    cd backend && python worker.py
+
+server is imported inside main() only: spawned search ingest workers
+re-import this module, and must not each load server and its Mongo client.
+"""
+import asyncio
+import logging
+import signal
+
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    import server
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    await server.job_pool.start()
+    await server.outbox_sender.start()
+    logger.info(f"Job worker {server.job_pool.worker_prefix} running {server.job_pool.concurrency} workers")
+    try:
+        await stop.wait()
+    finally:
+        await server.job_pool.stop()
+        await server.outbox_sender.stop()
+        server.client.close()
+        if server.search_ingest_executor is not None:
+            server.search_ingest_executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""Helpers shared by the benchmark scripts.
+
+Only the standard library is used here, so scripts that don't drive the
+HTTP API (jobs.py) can import it without httpx.
+"""
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ThrowawayMongod:
+    """mongod on a random port with its data in a temporary directory"""
+
+    def __init__(self, binary):
+        self.binary = binary
+        self.process = None
+        self.dbpath = None
+        self.port = None
+
+    @property
+    def url(self):
+        return f"mongodb://127.0.0.1:{self.port}"
+
+    def start(self):
+        self.dbpath = tempfile.mkdtemp(prefix="bench-mongod-")
+        self.port = free_port()
+        self.process = subprocess.Popen(
+            [self.binary, "--dbpath", self.dbpath, "--port", str(self.port), "--bind_ip", "127.0.0.1", "--quiet"],
+            stdout=subprocess.DEVNULL,
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"mongod exited with status {self.process.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.5):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError("mongod did not start listening in time")
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+        if self.dbpath:
+            shutil.rmtree(self.dbpath, ignore_errors=True)
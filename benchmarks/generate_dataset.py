@@ -0,0 +1,244 @@
+"""Generate a lodge- and library-sized dataset for benchmarks.
+
+Bulk-inserts users across statuses and levels and work_files whose
+uploaders follow a Zipf distribution (a few prolific members, a long tail)
+and whose titles reuse a skewed vocabulary. With --pdfs N it also writes N
+real PDF blobs, with log-normally distributed sizes, into the
+content-addressed upload layout and shares them between the works.
+
+The same --seed always produces the same documents and files. Every
+generated member can log in with --password.
+
+    python benchmarks/generate_dataset.py --users 100000 --works 1000000 --drop
+    python benchmarks/generate_dataset.py --users 2000 --works 20000 --pdfs 500 --upload-dir /tmp/uploads
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+FIRST_NAMES = [
+    "João", "José", "Antônio", "Francisco", "Carlos", "Paulo", "Pedro", "Lucas", "Luiz", "Marcos",
+    "Luís", "Gabriel", "Rafael", "Daniel", "Marcelo", "Bruno", "Eduardo", "Felipe", "Raimundo", "Rodrigo",
+]
+LAST_NAMES = [
+    "Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+    "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Soares", "Fernandes", "Vieira", "Barbosa",
+]
+TITLE_WORDS = [
+    "Simbolismo", "Templo", "Luz", "Coluna", "Esquadro", "Compasso", "Pedra", "Bruta", "Polida", "Oriente",
+    "Ocidente", "Loja", "Ritual", "Landmarks", "Virtude", "Fraternidade", "Igualdade", "Liberdade", "Grau",
+    "Aprendiz", "Companheiro", "Mestre", "Painel", "Avental", "Malhete", "Cadeia", "União", "História",
+    "Filosofia", "Moral", "Estudo", "Reflexões", "Sobre", "Instrução", "Tradição", "Origem", "Salomão",
+    "Hiram", "Prumo", "Nível", "Régua", "Alegoria", "Mistérios", "Caminho", "Trabalho", "Silêncio",
+]
+STATUSES = ["approved", "pending", "rejected"]
+BATCH_SIZE = 10000
+
+
+def parse_mix(text, keys):
+    """Parse 'a=0.8,b=0.2' into probabilities ordered like keys"""
+    weights = dict.fromkeys(keys, 0.0)
+    for part in text.split(","):
+        key, _, value = part.partition("=")
+        if key.strip() not in weights:
+            raise argparse.ArgumentTypeError(f"unknown key {key!r}, expected one of {keys}")
+        weights[key.strip()] = float(value)
+    total = sum(weights.values())
+    return np.array([weights[key] / total for key in keys])
+
+
+def uuids(rng, count):
+    raw = rng.integers(0, 256, size=(count, 16), dtype=np.uint8)
+    return [str(uuid.UUID(bytes=row.tobytes(), version=4)) for row in raw]
+
+
+def generate_users(rng, count, status_mix, level_mix, password_hash, now):
+    ids = uuids(rng, count)
+    statuses = rng.choice(len(STATUSES), size=count, p=status_mix)
+    levels = rng.choice([1, 2, 3], size=count, p=level_mix)
+    first = rng.integers(0, len(FIRST_NAMES), size=count)
+    last = rng.integers(0, len(LAST_NAMES), size=(count, 2))
+    # Members joined over the last ten years
+    joined_minutes_ago = rng.integers(0, 10 * 365 * 24 * 60, size=count)
+    users = []
+    for i in range(count):
+        users.append({
+            "id": ids[i],
+            "email": f"member{i}@lodge.example.com",
+            "full_name": f"{FIRST_NAMES[first[i]]} {LAST_NAMES[last[i, 0]]} {LAST_NAMES[last[i, 1]]}",
+            "level": int(levels[i]),
+            "status": STATUSES[statuses[i]],
+            "created_at": now - timedelta(minutes=int(joined_minutes_ago[i])),
+            "approved_at": None,
+            "approved_by": None,
+            "password_hash": password_hash,
+        })
+    return users
+
+
+def pdf_bytes(seed, index, size):
+    """A small valid-looking PDF padded with deterministic noise to `size` bytes"""
+    header = f"%PDF-1.4\n% generated dataset blob {index}\n".encode()
+    trailer = b"\n%%EOF\n"
+    padding = max(0, size - len(header) - len(trailer))
+    noise = np.random.default_rng([seed, index]).integers(0, 256, size=padding, dtype=np.uint8).tobytes()
+    return header + noise + trailer
+
+
+def write_blob(seed, index, size, blob_path):
+    data = pdf_bytes(seed, index, size)
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not path.exists():
+        temp_path = path.with_name(f".{path.name}.part")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+    return sha256, str(path), len(data)
+
+
+def generate_blobs(args, rng, blob_path):
+    sizes = np.clip(
+        rng.lognormal(mean=np.log(args.pdf_median_kb * 1024), sigma=args.pdf_sigma, size=args.pdfs),
+        1024, args.pdf_max_kb * 1024
+    ).astype(int)
+    with ThreadPoolExecutor(max_workers=args.file_workers) as pool:
+        return list(pool.map(lambda item: write_blob(args.seed, item[0], int(item[1]), blob_path), enumerate(sizes)))
+
+
+def generate_works(rng, start, count, uploaders, blobs, now, upload_dir):
+    """One batch of work documents; uploaders are sampled with Zipf skew"""
+    ids = uuids(rng, count)
+    owner_rank = (rng.zipf(1.3, size=count) - 1) % len(uploaders)
+    word_count = rng.integers(2, 6, size=count)
+    # Zipf over the vocabulary makes some words, and so some titles, far more common
+    words = (rng.zipf(1.6, size=(count, 5)) - 1) % len(TITLE_WORDS)
+    level_draw = rng.random(size=count)
+    age_fraction = rng.random(size=count)
+    blob_index = rng.integers(0, len(blobs), size=count) if blobs else None
+    works = []
+    for i in range(count):
+        owner = uploaders[owner_rank[i]]
+        # Members upload to their own level or a level below
+        level = 1 + int(level_draw[i] * owner["level"])
+        title = " ".join(TITLE_WORDS[w] for w in words[i, :word_count[i]])
+        seconds_since_join = (now - owner["created_at"]).total_seconds()
+        work = {
+            "id": ids[i],
+            "title": title,
+            "filename": f"{title.lower().replace(' ', '_')}_{start + i}.pdf",
+            "level": level,
+            "uploaded_by": owner["id"],
+            "uploaded_by_name": owner["full_name"],
+            "uploaded_at": owner["created_at"] + timedelta(seconds=float(age_fraction[i]) * seconds_since_join),
+        }
+        if blobs:
+            sha256, path, size = blobs[blob_index[i]]
+            work.update({"file_path": path, "size": size, "sha256": sha256})
+        else:
+            work["file_path"] = str(upload_dir / f"{ids[i]}.pdf")
+        works.append(work)
+    return works
+
+
+async def insert_batches(collection, documents, batch_size):
+    for start in range(0, len(documents), batch_size):
+        await collection.insert_many(documents[start:start + batch_size], ordered=False)
+
+
+async def run(args):
+    # server reads UPLOAD_DIR and the Mongo settings at import time
+    if args.upload_dir:
+        os.environ["UPLOAD_DIR"] = args.upload_dir
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    from indexes import apply_indexes
+
+    db = server.client[args.database or f"{server.db.name}_scale"]
+    if args.drop:
+        for name in ("users", "work_files", "blobs"):
+            await db[name].drop()
+
+    rng = np.random.default_rng(args.seed)
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    # Fixed salt keeps the dataset byte-for-byte reproducible
+    salt = hashlib.sha256(str(args.seed).encode()).hexdigest()[:21] + "e"
+    password_hash = server.bcrypt_hash.using(salt=salt, rounds=10).hash(args.password)
+
+    started = time.perf_counter()
+    users = generate_users(
+        rng, args.users, parse_mix(args.status_mix, STATUSES),
+        parse_mix(args.level_mix, ["1", "2", "3"]), password_hash, now
+    )
+    await insert_batches(db.users, users, args.batch_size)
+    print(f"users:  {len(users):>9} in {time.perf_counter() - started:6.1f}s")
+
+    blobs = []
+    blob_docs = {}
+    refcounts = {}
+    if args.pdfs:
+        started = time.perf_counter()
+        blobs = await asyncio.get_running_loop().run_in_executor(None, generate_blobs, args, rng, server.blob_path)
+        for sha256, path, size in blobs:
+            blob_docs[sha256] = {"sha256": sha256, "path": path, "size": size, "refcount": 0, "created_at": now}
+        print(f"pdfs:   {len(blob_docs):>9} in {time.perf_counter() - started:6.1f}s")
+
+    approved = [user for user in users if user["status"] == "approved"]
+    if not approved:
+        raise SystemExit("No approved users to own the works; adjust --status-mix")
+
+    started = time.perf_counter()
+    for start in range(0, args.works, args.batch_size):
+        count = min(args.batch_size, args.works - start)
+        works = generate_works(rng, start, count, approved, blobs, now, server.UPLOAD_DIR)
+        for work in works:
+            if blobs:
+                refcounts[work["sha256"]] = refcounts.get(work["sha256"], 0) + 1
+        await db.work_files.insert_many(works, ordered=False)
+    print(f"works:  {args.works:>9} in {time.perf_counter() - started:6.1f}s")
+
+    if blobs:
+        # Blobs no work drew are left on disk but get no record, like an orphaned upload
+        for sha256, count in refcounts.items():
+            blob_docs[sha256]["refcount"] = count
+        referenced = [doc for doc in blob_docs.values() if doc["refcount"]]
+        await insert_batches(db.blobs, referenced, args.batch_size)
+
+    started = time.perf_counter()
+    await apply_indexes(db)
+    print(f"indexes built in {time.perf_counter() - started:6.1f}s (database {db.name})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--works", type=int, default=1000000)
+    parser.add_argument("--status-mix", default="approved=0.85,pending=0.1,rejected=0.05")
+    parser.add_argument("--level-mix", default="1=0.5,2=0.3,3=0.2")
+    parser.add_argument("--password", default="Dataset123!", help="password of every generated member")
+    parser.add_argument("--seed", type=int, default=12)
+    parser.add_argument("--database", help="target database (default: <DB_NAME>_scale)")
+    parser.add_argument("--drop", action="store_true", help="drop users, work_files and blobs first")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--pdfs", type=int, default=0, help="number of distinct PDF blobs to write (0: none)")
+    parser.add_argument("--pdf-median-kb", type=float, default=300)
+    parser.add_argument("--pdf-sigma", type=float, default=0.8, help="log-normal spread of PDF sizes")
+    parser.add_argument("--pdf-max-kb", type=float, default=20 * 1024)
+    parser.add_argument("--file-workers", type=int, default=8)
+    parser.add_argument("--upload-dir", help="uploads directory for the blobs (default: UPLOAD_DIR)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measure job queue throughput against a real mongod.
+
+Enqueues --jobs no-op jobs across a few priorities, then drains them with
+a JobWorkerPool of --concurrency workers and reports enqueue and
+claim-to-completion rates. Starts a throwaway mongod unless --mongo-url is
+given; the benchmark database is dropped afterwards.
+
+    python benchmarks/jobs.py --jobs 20000 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from indexes import INDEX_SPECS, apply_indexes  # noqa: E402
+from jobs import JobQueue, JobWorkerPool, new_job  # noqa: E402
+from common import ThrowawayMongod  # noqa: E402
+
+
+async def run(mongo_url, args):
+    client = AsyncIOMotorClient(mongo_url, maxPoolSize=max(100, args.concurrency * 2))
+    db = client[f"bench_jobs_{uuid.uuid4().hex[:8]}"]
+    try:
+        await apply_indexes(db, [spec for spec in INDEX_SPECS if spec.collection == "jobs"])
+        queue = JobQueue(db)
+
+        started = time.perf_counter()
+        for start in range(0, args.jobs, args.batch_size):
+            count = min(args.batch_size, args.jobs - start)
+            await queue.enqueue_many([new_job("noop", {"n": start + i}, priority=(start + i) % 3) for i in range(count)])
+        enqueue_seconds = time.perf_counter() - started
+        print(f"enqueue  {args.jobs / enqueue_seconds:9.0f} jobs/s ({args.jobs} in {enqueue_seconds:.2f}s)")
+
+        done = asyncio.Event()
+        completed = 0
+
+        async def noop(payload):
+            nonlocal completed
+            completed += 1
+            if completed == args.jobs:
+                done.set()
+
+        pool = JobWorkerPool(queue, {"noop": noop}, concurrency=args.concurrency, poll_interval=0.05)
+        started = time.perf_counter()
+        await pool.start()
+        await done.wait()
+        # The last completions are written after their handlers return
+        while await db.jobs.count_documents({"status": {"$ne": "done"}}):
+            await asyncio.sleep(0.01)
+        drain_seconds = time.perf_counter() - started
+        await pool.stop()
+        print(f"process  {args.jobs / drain_seconds:9.0f} jobs/s ({args.jobs} in {drain_seconds:.2f}s, "
+              f"concurrency {args.concurrency})")
+    finally:
+        await client.drop_database(db.name)
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of starting a throwaway mongod")
+    parser.add_argument("--mongod", default=os.environ.get("MONGOD", "mongod"), help="mongod binary")
+    args = parser.parse_args()
+
+    mongod = None
+    if args.mongo_url:
+        mongo_url = args.mongo_url
+    else:
+        mongod = ThrowawayMongod(args.mongod)
+        mongod.start()
+        mongo_url = mongod.url
+    try:
+        asyncio.run(run(mongo_url, args))
+    finally:
+        if mongod:
+            mongod.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Measure /api/works latency while a burst of logins runs concurrently.
+
+Mounts the FastAPI app in-process against a throwaway mongod (or
+--mongo-url) and a fresh database that is dropped afterwards.
+
+    python benchmarks/login_burst.py --logins 200 --login-concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from common import ThrowawayMongod, percentile
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def summarize(name, samples):
+    print(
+        f"{name:<28} n={len(samples):<5} "
+        f"p50={percentile(samples, 50) * 1000:7.1f}ms "
+        f"p95={percentile(samples, 95) * 1000:7.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:7.1f}ms"
+    )
+
+
+async def poll_works(client, headers, stop, samples):
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/api/works", headers=headers)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+        await asyncio.sleep(0.01)
+
+
+async def login_worker(client, credentials, remaining, samples):
+    while remaining:
+        remaining.pop()
+        started = time.perf_counter()
+        response = await client.post("/api/login", json=credentials)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+
+
+async def run(args):
+    # server reads its configuration at import time
+    search_index_dir = tempfile.mkdtemp(prefix="bench-search-")
+    os.environ["SEARCH_INDEX_DIR"] = search_index_dir
+    os.environ["JOB_WORKER_MODE"] = "external"
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    # Every login in the burst comes from one client for one email
+    server.LOGIN_THROTTLE_MAX_PER_EMAIL = server.LOGIN_THROTTLE_MAX_PER_IP = 0
+
+    email = f"bench-{uuid.uuid4().hex[:8]}@benchmark.example.com"
+    password = "BenchPass123!"
+    await server.db.users.insert_one({
+        "id": str(uuid.uuid4()),
+        "email": email,
+        "full_name": "Benchmark User",
+        "level": 3,
+        "status": "approved",
+        "created_at": datetime.now(timezone.utc),
+        "password_hash": server.get_password_hash(password),
+    })
+    credentials = {"email": email, "password": password}
+
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.post("/api/login", json=credentials)
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            # Baseline: /api/works alone
+            idle_samples = []
+            stop = asyncio.Event()
+            poller = asyncio.create_task(poll_works(client, headers, stop, idle_samples))
+            await asyncio.sleep(args.baseline_seconds)
+            stop.set()
+            await poller
+
+            # Same poller while logins hammer the hasher
+            busy_samples = []
+            login_samples = []
+            stop = asyncio.Event()
+            poller = asyncio.create_task(poll_works(client, headers, stop, busy_samples))
+            remaining = list(range(args.logins))
+            await asyncio.gather(*[
+                login_worker(client, credentials, remaining, login_samples)
+                for _ in range(args.login_concurrency)
+            ])
+            stop.set()
+            await poller
+    finally:
+        await server.client.drop_database(server.db.name)
+        server.client.close()
+        server.password_hasher.shutdown()
+        shutil.rmtree(search_index_dir, ignore_errors=True)
+
+    print(f"hash executor: {server.PASSWORD_HASH_EXECUTOR} x{server.password_hasher.workers}")
+    summarize("/api/works (idle)", idle_samples)
+    summarize("/api/works (during logins)", busy_samples)
+    summarize("/api/login", login_samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=16)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    parser.add_argument("--mongo-url", help="use this MongoDB instead of starting a throwaway mongod")
+    parser.add_argument("--mongod", default=os.environ.get("MONGOD", "mongod"), help="mongod binary")
+    args = parser.parse_args()
+
+    mongod = None
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+    else:
+        mongod = ThrowawayMongod(args.mongod)
+        mongod.start()
+        os.environ["MONGO_URL"] = mongod.url
+    os.environ["DB_NAME"] = f"bench_{uuid.uuid4().hex[:8]}"
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        if mongod:
+            mongod.stop()
+
+
+if __name__ == "__main__":
+    main()
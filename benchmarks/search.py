@@ -0,0 +1,94 @@
+"""Time /api/search queries against a synthetic index of many pages.
+
+Builds an index of --pages pages in --segments segments, with terms drawn
+from a Zipf-distributed vocabulary (a few very common terms, a long tail of
+rare ones), then times BM25 queries of common, mid-frequency and rare terms
+through SearchIndex. No PDFs or database are involved.
+
+    python benchmarks/search.py --pages 1000000 --index-dir /tmp/search-bench
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import search  # noqa: E402
+
+
+def build(index_dir, pages, segments, terms_per_page, vocabulary, seed):
+    rng = np.random.default_rng(seed)
+    term_hashes = search.hash_terms([f"term{i}" for i in range(vocabulary)])
+    infos = []
+    pages_per_segment = -(-pages // segments)
+    for number in range(segments):
+        count = min(pages_per_segment, pages - number * pages_per_segment)
+        if count <= 0:
+            break
+        ranks = (rng.zipf(1.1, size=(count, terms_per_page)) - 1) % vocabulary
+        docs = np.repeat(np.arange(count, dtype=np.int32), terms_per_page)
+        # Collapse repeated terms of a page into one posting with its frequency
+        pairs, tfs = np.unique(np.stack([docs, ranks.ravel()]), axis=1, return_counts=True)
+        info = search.write_segment(
+            index_dir,
+            [f"work-{number}-{i}" for i in range(count)],
+            np.arange(count), rng.integers(1, 4, size=count), np.ones(count),
+            np.full(count, terms_per_page),
+            term_hashes[pairs[1]], pairs[0], np.minimum(tfs, search.MAX_TERM_FREQUENCY),
+        )
+        info["generation"] = number + 1
+        infos.append(info)
+        print(f"segment {number + 1}/{segments}: {count} pages")
+    search.write_manifest(index_dir, {"generation": len(infos), "segments": infos, "deleted": {}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=1000000)
+    parser.add_argument("--segments", type=int, default=10)
+    parser.add_argument("--terms-per-page", type=int, default=40)
+    parser.add_argument("--vocabulary", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--index-dir", help="keep the index here instead of a temporary directory")
+    args = parser.parse_args()
+
+    index_dir = Path(args.index_dir) if args.index_dir else Path(tempfile.mkdtemp(prefix="search-bench-"))
+    index_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        started = time.perf_counter()
+        build(index_dir, args.pages, args.segments, args.terms_per_page, args.vocabulary, args.seed)
+        print(f"built in {time.perf_counter() - started:.1f}s")
+
+        index = search.SearchIndex(index_dir)
+        # The top few ranks occur on almost every page, like the stopwords the tokenizer drops
+        queries = {
+            "common": "term10 term20",
+            "mid": "term50 term120 term300",
+            "rare": "term15000 term90000",
+        }
+        for name, query in queries.items():
+            index.search(query, 3)
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                hits = index.search(query, 3)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            print(
+                f"{name:<8} p50={timings[len(timings) // 2] * 1000:7.2f}ms "
+                f"p95={timings[int(len(timings) * 0.95)] * 1000:7.2f}ms hits={len(hits)}"
+            )
+    finally:
+        if not args.index_dir:
+            shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
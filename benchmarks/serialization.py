@@ -0,0 +1,79 @@
+"""Compare the cost of serializing 1000 works, before and after the fast path.
+
+"model" rebuilds WorkFile(**doc) for every Mongo document, validates the
+list against the response model and renders it with the stdlib JSON
+encoder, as FastAPI did for response_model=List[WorkFile]. "projected"
+renders documents fetched with WORK_PROJECTION straight through
+ORJSONResponse. No database is needed.
+
+    python benchmarks/serialization.py --works 1000 --repeat 200
+"""
+import argparse
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+
+
+def make_documents(count):
+    """Work documents shaped like motor returns them (ObjectId, naive UTC datetimes)"""
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "title": f"Trabalho sobre simbolismo {i}",
+            "filename": f"trabalho_{i}.pdf",
+            "file_path": f"/app/backend/uploads/blobs/ab/{uuid.uuid4().hex}.pdf",
+            "level": 1 + i % 3,
+            "uploaded_by": str(uuid.uuid4()),
+            "uploaded_by_name": f"Irmão {i}",
+            "uploaded_at": now - timedelta(minutes=i),
+            "size": 250_000 + i,
+            "sha256": uuid.uuid4().hex * 2,
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--works", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    documents = make_documents(args.works)
+    projected = [{key: value for key, value in doc.items() if server.WORK_PROJECTION.get(key)} for doc in documents]
+    response_model = TypeAdapter(List[server.WorkFile])
+
+    def model_path():
+        works = [server.WorkFile(**doc) for doc in documents]
+        validated = response_model.validate_python(works, from_attributes=True)
+        return JSONResponse(jsonable_encoder(validated)).body
+
+    def projected_path():
+        return ORJSONResponse({"items": projected, "next_cursor": None}).body
+
+    results = {}
+    for name, func in (("model", model_path), ("projected", projected_path)):
+        func()
+        seconds = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        results[name] = seconds
+        print(f"{name:<10} {seconds * 1000:8.2f}ms per {args.works} works ({len(func())} bytes)")
+    print(f"speedup    {results['model'] / results['projected']:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
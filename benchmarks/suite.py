@@ -0,0 +1,259 @@
+"""In-process endpoint benchmark suite.
+
+Starts a throwaway mongod (or uses --mongo-url), mounts the FastAPI app
+through httpx's ASGI transport and drives each endpoint at a fixed
+concurrency. Results (throughput, p50/p95/p99, errors) are written as JSON.
+
+    python benchmarks/suite.py run --output results.json
+    python benchmarks/suite.py run --output results.json --baseline baseline.json
+    python benchmarks/suite.py compare baseline.json results.json --threshold 0.15
+
+A comparison fails (exit status 1) when any scenario's p95 latency grows,
+or its throughput drops, by more than the threshold fraction.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+from common import ThrowawayMongod, percentile
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+SCENARIOS = ("login", "me", "works", "users-with-works", "upload", "download")
+BENCH_PASSWORD = "BenchPass123!"
+
+
+def make_pdf(size, marker):
+    body = f"%PDF-1.4\n% benchmark {marker}\n".encode()
+    return body + b"0" * max(0, size - len(body) - 6) + b"\n%%EOF"
+
+
+async def seed(server, members_per_level):
+    members = []
+    password_hash = server.get_password_hash(BENCH_PASSWORD)
+    for level in (1, 2, 3):
+        for i in range(members_per_level):
+            members.append({
+                "id": str(uuid.uuid4()),
+                "email": f"bench{level}-{i}@benchmark.example.com",
+                "full_name": f"Bench {level}-{i}",
+                "level": level,
+                "status": "approved",
+                "created_at": datetime.now(timezone.utc),
+                "password_hash": password_hash,
+            })
+    await server.db.users.insert_many(members)
+    return members
+
+
+async def run_scenario(name, requests, concurrency, make_request):
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(index)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+    print(
+        f"{name:<18} {result['throughput_rps']:8.1f} req/s  "
+        f"p50={result['p50_ms']:7.1f}ms p95={result['p95_ms']:7.1f}ms p99={result['p99_ms']:7.1f}ms "
+        f"errors={errors}"
+    )
+    return result
+
+
+async def run_suite(args):
+    # server reads its configuration at import time
+    upload_dir = tempfile.mkdtemp(prefix="bench-uploads-")
+    search_index_dir = tempfile.mkdtemp(prefix="bench-search-")
+    os.environ["UPLOAD_DIR"] = upload_dir
+    # Keep ingestion out of the real index, and out of the timed scenarios: with
+    # external workers uploads only enqueue their index_work jobs
+    os.environ["SEARCH_INDEX_DIR"] = search_index_dir
+    os.environ["JOB_WORKER_MODE"] = "external"
+    sys.path.insert(0, str(BACKEND_DIR))
+    import server
+
+    # All simulated clients share one address
+    server.LOGIN_THROTTLE_MAX_PER_IP = 0
+    await server.app.router.startup()
+    await server.app.state.index_build
+    try:
+        members = await seed(server, args.members_per_level)
+        masters = [member for member in members if member["level"] == 3]
+        tokens = [
+            server.create_access_token({"sub": member["email"]}, timedelta(minutes=30))
+            for member in masters
+        ]
+        headers = [{"Authorization": f"Bearer {token}"} for token in tokens]
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            seeded = await client.post(
+                "/api/upload-work/1",
+                params={"title": "Benchmark download"},
+                files={"file": ("bench.pdf", make_pdf(args.pdf_size, "download"), "application/pdf")},
+                headers=headers[0],
+            )
+            seeded.raise_for_status()
+            download_id = seeded.json()["file_id"]
+            run_id = uuid.uuid4().hex[:8]
+
+            requests_by_scenario = {
+                "login": lambda i: client.post("/api/login", json={
+                    "email": members[i % len(members)]["email"], "password": BENCH_PASSWORD
+                }),
+                "me": lambda i: client.get("/api/me", headers=headers[i % len(headers)]),
+                "works": lambda i: client.get("/api/works", headers=headers[i % len(headers)]),
+                "users-with-works": lambda i: client.get(
+                    "/api/users-with-works", params={"page": 1 + i % 5, "limit": 20}, headers=headers[i % len(headers)]
+                ),
+                "upload": lambda i: client.post(
+                    "/api/upload-work/1",
+                    params={"title": f"Benchmark upload {i}"},
+                    files={"file": (f"bench{i}.pdf", make_pdf(args.pdf_size, f"{run_id}-{i}"), "application/pdf")},
+                    headers=headers[i % len(headers)],
+                ),
+                "download": lambda i: client.get(f"/api/download-work/{download_id}", headers=headers[i % len(headers)]),
+            }
+
+            results = {}
+            for name in args.scenarios:
+                requests = args.login_requests if name == "login" else args.requests
+                results[name] = await run_scenario(
+                    name, requests, args.concurrency, requests_by_scenario[name]
+                )
+    finally:
+        await server.client.drop_database(server.db.name)
+        await server.app.router.shutdown()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        shutil.rmtree(search_index_dir, ignore_errors=True)
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "settings": {
+            "requests": args.requests,
+            "login_requests": args.login_requests,
+            "concurrency": args.concurrency,
+            "members_per_level": args.members_per_level,
+            "pdf_size": args.pdf_size,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current, threshold):
+    """Print the per-scenario deltas and return the scenarios that regressed"""
+    regressions = []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if not base:
+            print(f"{name:<18} no baseline")
+            continue
+        p95_change = (result["p95_ms"] - base["p95_ms"]) / base["p95_ms"] if base["p95_ms"] else 0.0
+        rps_change = (result["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] \
+            if base["throughput_rps"] else 0.0
+        regressed = p95_change > threshold or rps_change < -threshold or result["errors"] > base["errors"]
+        print(
+            f"{name:<18} p95 {base['p95_ms']:7.1f} -> {result['p95_ms']:7.1f}ms ({p95_change:+.0%})  "
+            f"throughput {base['throughput_rps']:7.1f} -> {result['throughput_rps']:7.1f} ({rps_change:+.0%})"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subcommands.add_parser("run", help="run the suite")
+    run_parser.add_argument("--output", required=True, help="where to write the JSON results")
+    run_parser.add_argument("--mongo-url", help="use this MongoDB instead of starting a throwaway mongod")
+    run_parser.add_argument("--mongod", default=os.environ.get("MONGOD", "mongod"), help="mongod binary")
+    run_parser.add_argument("--scenarios", type=lambda value: value.split(","), default=list(SCENARIOS))
+    run_parser.add_argument("--requests", type=int, default=500)
+    run_parser.add_argument("--login-requests", type=int, default=100)
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--members-per-level", type=int, default=50)
+    run_parser.add_argument("--pdf-size", type=int, default=256 * 1024)
+    run_parser.add_argument("--baseline", help="compare against this results file after the run")
+    run_parser.add_argument("--threshold", type=float, default=0.15)
+
+    compare_parser = subcommands.add_parser("compare", help="compare two results files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        baseline = json.loads(Path(args.baseline).read_text())
+        current = json.loads(Path(args.current).read_text())
+        return 1 if compare(baseline, current, args.threshold) else 0
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    mongod = None
+    if args.mongo_url:
+        os.environ["MONGO_URL"] = args.mongo_url
+    else:
+        mongod = ThrowawayMongod(args.mongod)
+        mongod.start()
+        os.environ["MONGO_URL"] = mongod.url
+    os.environ["DB_NAME"] = f"bench_{uuid.uuid4().hex[:8]}"
+
+    try:
+        report = asyncio.run(run_suite(args))
+    finally:
+        if mongod:
+            mongod.stop()
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        return 1 if compare(baseline, report, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Time /api/users-with-works on a large lodge.
+
+Seeds a separate database (<DB_NAME>_bench by default) with approved users
+and their works, then requests the first, a middle and the last page. The
+database is dropped afterwards unless --keep is given.
+
+    python benchmarks/users_with_works.py --users 10000 --works 100000
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+import server  # noqa: E402
+from indexes import apply_indexes  # noqa: E402
+
+BATCH_SIZE = 5000
+
+
+async def seed(db, user_count, work_count, rng):
+    now = datetime.now(timezone.utc)
+    users = []
+    for i in range(user_count):
+        users.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "email": f"member{i}@benchmark.example.com",
+            "full_name": f"Member {i}",
+            "level": rng.choice([1, 1, 1, 2, 2, 3]),
+            "status": "approved",
+            "created_at": now - timedelta(minutes=user_count - i),
+            "password_hash": "",
+        })
+    for start in range(0, len(users), BATCH_SIZE):
+        await db.users.insert_many(users[start:start + BATCH_SIZE], ordered=False)
+
+    works = []
+    for i in range(work_count):
+        owner = users[rng.randrange(user_count)]
+        works.append({
+            "id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "title": f"Trabalho {i}",
+            "filename": f"trabalho_{i}.pdf",
+            "file_path": f"/app/backend/uploads/{i}.pdf",
+            "level": owner["level"],
+            "uploaded_by": owner["id"],
+            "uploaded_by_name": owner["full_name"],
+            "uploaded_at": now - timedelta(seconds=work_count - i),
+        })
+        if len(works) == BATCH_SIZE:
+            await db.work_files.insert_many(works, ordered=False)
+            works = []
+    if works:
+        await db.work_files.insert_many(works, ordered=False)
+
+    await apply_indexes(db)
+    return users
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    db = server.client[args.database or f"{server.db.name}_bench"]
+    await db.users.drop()
+    await db.work_files.drop()
+    server.db = db
+
+    started = time.perf_counter()
+    users = await seed(db, args.users, args.works, rng)
+    print(f"seeded {args.users} users / {args.works} works in {time.perf_counter() - started:.1f}s")
+
+    viewer = next(user for user in users if user["level"] == 3)
+    token = server.create_access_token({"sub": viewer["email"]}, timedelta(minutes=30))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    total_pages = None
+    transport = httpx.ASGITransport(app=server.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            response = await client.get("/api/users-with-works", params={"limit": args.limit}, headers=headers)
+            response.raise_for_status()
+            total_pages = response.json()["pagination"]["total_pages"]
+
+            for page in sorted({1, max(1, total_pages // 2), total_pages}):
+                samples = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = await client.get(
+                        "/api/users-with-works",
+                        params={"page": page, "limit": args.limit},
+                        headers=headers
+                    )
+                    samples.append(time.perf_counter() - started)
+                    response.raise_for_status()
+                samples.sort()
+                print(
+                    f"page {page:>5}/{total_pages}: "
+                    f"median={samples[len(samples) // 2] * 1000:7.1f}ms "
+                    f"max={samples[-1] * 1000:7.1f}ms"
+                )
+    finally:
+        if not args.keep:
+            await server.client.drop_database(db.name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--works", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=12)
+    parser.add_argument("--database", help="database to seed (default: <DB_NAME>_bench)")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded database")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
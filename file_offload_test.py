@@ -0,0 +1,232 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import requests
+
+CONFIG_TEMPLATE = Path(__file__).parent / "deploy" / "nginx-file-offload.conf"
+
+
+class FileOffloadTester:
+    """Check PDF delivery through a local nginx in front of a backend running
+    with FILE_DELIVERY_MODE=x-accel-redirect."""
+
+    def __init__(self, backend_url, upload_dir, listen, email, password):
+        self.backend_url = backend_url.rstrip("/")
+        self.upload_dir = Path(upload_dir).resolve()
+        self.listen = listen
+        self.email = email
+        self.password = password
+        self.proxy_url = f"http://{listen}"
+        self.tests_run = 0
+        self.tests_passed = 0
+        self.session = requests.Session()
+        self.nginx = None
+        self.prefix = None
+        self.token = None
+        self.work_id = None
+        self.etag = None
+        self.pdf_bytes = b"%PDF-1.4\n" + os.urandom(256 * 1024) + b"\n%%EOF\n"
+
+    def log_test(self, name, success, details=""):
+        """Log test results"""
+        self.tests_run += 1
+        if success:
+            self.tests_passed += 1
+            print(f"✅ {name} - PASSED {details}")
+        else:
+            print(f"❌ {name} - FAILED {details}")
+        return success
+
+    def start_nginx(self):
+        self.prefix = Path(tempfile.mkdtemp(prefix="nginx-offload-"))
+        config = CONFIG_TEMPLATE.read_text()
+        for placeholder, value in {
+            "{{PREFIX}}": str(self.prefix),
+            "{{LISTEN}}": self.listen,
+            "{{BACKEND_URL}}": self.backend_url,
+            "{{UPLOAD_DIR}}": str(self.upload_dir),
+        }.items():
+            config = config.replace(placeholder, value)
+        config_path = self.prefix / "nginx.conf"
+        config_path.write_text(config)
+
+        self.nginx = subprocess.Popen(
+            ["nginx", "-p", str(self.prefix), "-c", str(config_path), "-g", "daemon off;"]
+        )
+        host, port = self.listen.rsplit(":", 1)
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            try:
+                with socket.create_connection((host, int(port)), timeout=0.5):
+                    return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError("nginx did not start listening in time")
+
+    def stop_nginx(self):
+        if self.nginx:
+            self.nginx.terminate()
+            self.nginx.wait(timeout=10)
+
+    def auth_headers(self):
+        return {"Authorization": f"Bearer {self.token}"}
+
+    def test_login_and_upload(self):
+        print("\n🔍 Logging in and uploading a test PDF through nginx...")
+        response = self.session.post(
+            f"{self.proxy_url}/api/login",
+            json={"email": self.email, "password": self.password}
+        )
+        if not self.log_test("Login through proxy", response.status_code == 200, response.text[:200]):
+            return False
+        self.token = response.json()["access_token"]
+
+        response = self.session.post(
+            f"{self.proxy_url}/api/upload-work/1",
+            params={"title": f"Offload test {uuid.uuid4().hex[:8]}"},
+            files={"file": ("offload_test.pdf", self.pdf_bytes, "application/pdf")},
+            headers=self.auth_headers()
+        )
+        if not self.log_test("Upload through proxy", response.status_code == 200, response.text[:200]):
+            return False
+        self.work_id = response.json()["file_id"]
+        return True
+
+    def test_backend_offloads(self):
+        print("\n🔍 Checking the backend answers with X-Accel-Redirect only...")
+        response = self.session.get(
+            f"{self.backend_url}/api/download-work/{self.work_id}",
+            headers=self.auth_headers()
+        )
+        redirect = response.headers.get("x-accel-redirect", "")
+        self.log_test(
+            "Backend sets X-Accel-Redirect",
+            response.status_code == 200 and redirect.startswith("/protected-uploads/"),
+            redirect
+        )
+        self.log_test("Backend sends no body", len(response.content) == 0, f"{len(response.content)} bytes")
+        self.etag = response.headers.get("etag")
+        self.log_test("Backend sets an ETag", bool(self.etag), str(self.etag))
+
+    def test_proxy_delivery(self, endpoint, disposition):
+        print(f"\n🔍 Downloading /api/{endpoint} through nginx...")
+        response = self.session.get(
+            f"{self.proxy_url}/api/{endpoint}/{self.work_id}",
+            headers=self.auth_headers()
+        )
+        self.log_test(f"{endpoint} status", response.status_code == 200, str(response.status_code))
+        self.log_test(f"{endpoint} bytes match", response.content == self.pdf_bytes, f"{len(response.content)} bytes")
+        self.log_test(
+            f"{endpoint} content type",
+            response.headers.get("content-type", "").startswith("application/pdf"),
+            response.headers.get("content-type", "")
+        )
+        self.log_test(
+            f"{endpoint} disposition",
+            response.headers.get("content-disposition", "").startswith(disposition),
+            response.headers.get("content-disposition", "")
+        )
+        self.log_test(
+            f"{endpoint} cache control",
+            "immutable" in response.headers.get("cache-control", ""),
+            response.headers.get("cache-control", "")
+        )
+        self.log_test(f"{endpoint} hides internal path", "x-accel-redirect" not in response.headers)
+        self.log_test(
+            f"{endpoint} keeps the backend ETag",
+            response.headers.get("etag") == self.etag,
+            f"{response.headers.get('etag')} vs {self.etag}"
+        )
+
+        response = self.session.get(
+            f"{self.proxy_url}/api/{endpoint}/{self.work_id}",
+            headers={**self.auth_headers(), "If-None-Match": str(self.etag)}
+        )
+        self.log_test(
+            f"{endpoint} revalidation",
+            response.status_code == 304 and not response.content,
+            str(response.status_code)
+        )
+
+        response = self.session.get(
+            f"{self.proxy_url}/api/{endpoint}/{self.work_id}",
+            headers={**self.auth_headers(), "Range": "bytes=0-4"}
+        )
+        self.log_test(
+            f"{endpoint} range request",
+            response.status_code == 206 and response.content == self.pdf_bytes[:5],
+            f"{response.status_code} {response.headers.get('content-range', '')}"
+        )
+
+        response = self.session.get(
+            f"{self.proxy_url}/api/{endpoint}/{self.work_id}",
+            headers={**self.auth_headers(), "Range": "bytes=0-4", "If-Range": str(self.etag)}
+        )
+        self.log_test(
+            f"{endpoint} range with current If-Range",
+            response.status_code == 206 and response.content == self.pdf_bytes[:5],
+            str(response.status_code)
+        )
+
+        response = self.session.get(
+            f"{self.proxy_url}/api/{endpoint}/{self.work_id}",
+            headers={**self.auth_headers(), "Range": "bytes=0-4", "If-Range": '"stale"'}
+        )
+        self.log_test(
+            f"{endpoint} range with stale If-Range",
+            response.status_code == 200 and response.content == self.pdf_bytes,
+            str(response.status_code)
+        )
+
+    def test_internal_location_hidden(self):
+        print("\n🔍 Checking the internal location is not reachable directly...")
+        response = self.session.get(f"{self.proxy_url}/protected-uploads/")
+        self.log_test("Internal location returns 404", response.status_code == 404, str(response.status_code))
+
+    def cleanup(self):
+        if self.work_id:
+            self.session.delete(
+                f"{self.proxy_url}/api/delete-work/{self.work_id}",
+                headers=self.auth_headers()
+            )
+
+    def run_all_tests(self):
+        print("🚀 Starting file offload tests")
+        print("=" * 70)
+        self.start_nginx()
+        try:
+            if self.test_login_and_upload():
+                self.test_backend_offloads()
+                self.test_proxy_delivery("work-file", "inline")
+                self.test_proxy_delivery("download-work", "attachment")
+                self.test_internal_location_hidden()
+        finally:
+            self.cleanup()
+            self.stop_nginx()
+
+        print("\n" + "=" * 70)
+        print(f"📊 FILE OFFLOAD TEST RESULTS: {self.tests_passed}/{self.tests_run} tests passed")
+        return 0 if self.tests_passed == self.tests_run else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify X-Accel-Redirect PDF delivery through a local nginx")
+    parser.add_argument("--backend-url", default="http://127.0.0.1:8001")
+    parser.add_argument("--upload-dir", default=os.environ.get("UPLOAD_DIR", "/app/backend/uploads"))
+    parser.add_argument("--listen", default="127.0.0.1:8088")
+    parser.add_argument("--email", required=True, help="approved account allowed to upload to level 1 and delete works")
+    parser.add_argument("--password", required=True)
+    args = parser.parse_args()
+    tester = FileOffloadTester(args.backend_url, args.upload_dir, args.listen, args.email, args.password)
+    return tester.run_all_tests()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
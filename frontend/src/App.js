@@ -24,6 +24,83 @@ import { Eye, Upload, Download, Trash2, Shield, Users, FileText, LogOut, Crown,
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Follow next_cursor until a cursor-paginated listing is exhausted
+const fetchAllPages = async (url) => {
+  const items = [];
+  let cursor = null;
+  do {
+    const response = await axios.get(url, { params: cursor ? { cursor } : {} });
+    items.push(...response.data.items);
+    cursor = response.data.next_cursor;
+  } while (cursor);
+  return items;
+};
+
+// Access tokens are short-lived: on a 401, trade the refresh token for a new
+// pair and retry the request once. Concurrent 401s share one refresh call.
+let refreshInFlight = null;
+
+const storeTokens = (accessToken, refreshToken) => {
+  localStorage.setItem('token', accessToken);
+  localStorage.setItem('refreshToken', refreshToken);
+  axios.defaults.headers.common['Authorization'] = `Bearer ${accessToken}`;
+};
+
+const clearTokens = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refreshToken');
+  delete axios.defaults.headers.common['Authorization'];
+};
+
+const refreshAccessToken = () => {
+  if (!refreshInFlight) {
+    const refreshToken = localStorage.getItem('refreshToken');
+    refreshInFlight = axios.post(`${API}/token/refresh`, { refresh_token: refreshToken })
+      .then((response) => {
+        storeTokens(response.data.access_token, response.data.refresh_token);
+        return response.data.access_token;
+      })
+      .catch((error) => {
+        // Another tab rotated the same token first; carry on with its pair
+        if (localStorage.getItem('refreshToken') !== refreshToken && localStorage.getItem('token')) {
+          storeTokens(localStorage.getItem('token'), localStorage.getItem('refreshToken'));
+          return localStorage.getItem('token');
+        }
+        clearTokens();
+        window.dispatchEvent(new Event('auth:expired'));
+        throw error;
+      })
+      .finally(() => {
+        refreshInFlight = null;
+      });
+  }
+  return refreshInFlight;
+};
+
+axios.interceptors.response.use(undefined, async (error) => {
+  const request = error.config;
+  const isAuthCall = request?.url?.startsWith(`${API}/token/`) || request?.url === `${API}/login`;
+  if (error.response?.status !== 401 || !request || request._retried || isAuthCall || !localStorage.getItem('refreshToken')) {
+    throw error;
+  }
+  request._retried = true;
+  // Another tab may have refreshed already; its tokens are in localStorage
+  const stored = localStorage.getItem('token');
+  const token = stored && request.headers['Authorization'] !== `Bearer ${stored}` ? stored : await refreshAccessToken();
+  request.headers['Authorization'] = `Bearer ${token}`;
+  return axios(request);
+});
+
+// Hex SHA-256 of a file, or null where WebCrypto is unavailable (non-HTTPS origins)
+const sha256Hex = async (file) => {
+  if (!window.crypto?.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+};
+
+// Files per /upload-works request; the server parses at most 1000 files per multipart body
+const BULK_UPLOAD_BATCH_SIZE = 20;
+
 // Masonic levels mapping
 const LEVELS = {
   1: "aprendiz",
@@ -46,6 +123,10 @@ function AuthProvider({ children }) {
     } else {
       setLoading(false);
     }
+    
+    const handleExpired = () => setUser(null);
+    window.addEventListener('auth:expired', handleExpired);
+    return () => window.removeEventListener('auth:expired', handleExpired);
   }, []);
 
   const fetchUserInfo = async () => {
@@ -53,8 +134,7 @@ function AuthProvider({ children }) {
       const response = await axios.get(`${API}/me`);
       setUser(response.data);
     } catch (error) {
-      localStorage.removeItem('token');
-      delete axios.defaults.headers.common['Authorization'];
+      clearTokens();
     }
     setLoading(false);
   };
@@ -62,10 +142,9 @@ function AuthProvider({ children }) {
   const login = async (email, password) => {
     try {
       const response = await axios.post(`${API}/login`, { email, password });
-      const { access_token, user: userData } = response.data;
+      const { access_token, refresh_token, user: userData } = response.data;
       
-      localStorage.setItem('token', access_token);
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      storeTokens(access_token, refresh_token);
       setUser(userData);
       
       toast.success('Login realizado com sucesso!');
@@ -78,8 +157,12 @@ function AuthProvider({ children }) {
   };
 
   const logout = () => {
-    localStorage.removeItem('token');
-    delete axios.defaults.headers.common['Authorization'];
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (refreshToken) {
+      // Revoke the session server-side; nothing to do if that fails
+      axios.post(`${API}/logout`, { refresh_token: refreshToken }).catch(() => {});
+    }
+    clearTokens();
     setUser(null);
     toast.info('Logout realizado com sucesso');
   };
@@ -575,7 +658,7 @@ function Dashboard() {
   const [uploadDialog, setUploadDialog] = useState(false);
   const [uploadLevel, setUploadLevel] = useState('');
   const [uploadTitle, setUploadTitle] = useState('');
-  const [uploadFile, setUploadFile] = useState(null);
+  const [uploadFiles, setUploadFiles] = useState([]);
   const [loading, setLoading] = useState(false);
   const [expandedUsers, setExpandedUsers] = useState({});
   const [usersWithPasswords, setUsersWithPasswords] = useState([]);
@@ -604,7 +687,7 @@ function Dashboard() {
   const loadWorks = async () => {
     try {
       const response = await axios.get(`${API}/works`);
-      setWorks(response.data);
+      setWorks(response.data.works);
     } catch (error) {
       toast.error('Erro ao carregar trabalhos');
     }
@@ -624,8 +707,7 @@ function Dashboard() {
 
   const loadPendingUsers = async () => {
     try {
-      const response = await axios.get(`${API}/admin/pending-users`);
-      setPendingUsers(response.data);
+      setPendingUsers(await fetchAllPages(`${API}/admin/pending-users`));
     } catch (error) {
       toast.error('Erro ao carregar usuários pendentes');
     }
@@ -633,8 +715,7 @@ function Dashboard() {
 
   const loadAllUsers = async () => {
     try {
-      const response = await axios.get(`${API}/admin/all-users`);
-      setAllUsers(response.data);
+      setAllUsers(await fetchAllPages(`${API}/admin/all-users`));
     } catch (error) {
       toast.error('Erro ao carregar usuários');
     }
@@ -643,8 +724,7 @@ function Dashboard() {
   const loadUsersWithPasswords = async () => {
     if (!isSuperAdmin) return;
     try {
-      const response = await axios.get(`${API}/super-admin/all-users-with-passwords`);
-      setUsersWithPasswords(response.data);
+      setUsersWithPasswords(await fetchAllPages(`${API}/super-admin/all-users-with-passwords`));
     } catch (error) {
       toast.error('Erro ao carregar usuários com senhas');
     }
@@ -699,6 +779,26 @@ function Dashboard() {
     }
   };
 
+  const approveAllPending = async () => {
+    if (!window.confirm(`Aprovar todos os ${pendingUsers.length} usuários pendentes?`)) return;
+
+    try {
+      const response = await axios.post(`${API}/admin/users/bulk`, {
+        operations: pendingUsers.map((pendingUser) => ({ action: 'approve', user_id: pendingUser.id }))
+      });
+      const { succeeded, failed } = response.data;
+      if (failed > 0) {
+        toast.error(`${succeeded} usuários aprovados, ${failed} falharam`);
+      } else {
+        toast.success(`${succeeded} usuários aprovados com sucesso`);
+      }
+      loadPendingUsers();
+      loadAllUsers();
+    } catch (error) {
+      toast.error('Erro ao aprovar usuários');
+    }
+  };
+
   const deleteUser = async (userId) => {
     if (!window.confirm('Tem certeza que deseja deletar este usuário?')) return;
     
@@ -726,34 +826,14 @@ function Dashboard() {
 
   const downloadWork = async (workId) => {
     try {
-      // Fetch the PDF with authentication headers
-      const response = await axios.get(`${API}/download-work/${workId}`, {
-        responseType: 'blob',
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      // Get a short-lived signed URL so the browser streams the PDF itself
+      const response = await axios.post(`${API}/download-work/${workId}/link`);
       
-      // Get filename from response headers or use default
-      const contentDisposition = response.headers['content-disposition'];
-      let filename = 'trabalho.pdf';
-      if (contentDisposition) {
-        const filenameMatch = contentDisposition.match(/filename=([^;]+)/);
-        if (filenameMatch) {
-          filename = filenameMatch[1].replace(/"/g, '');
-        }
-      }
-      
-      // Create download link
-      const blob = new Blob([response.data], { type: 'application/pdf' });
-      const blobUrl = URL.createObjectURL(blob);
       const link = document.createElement('a');
-      link.href = blobUrl;
-      link.download = filename;
+      link.href = `${BACKEND_URL}${response.data.url}`;
       document.body.appendChild(link);
       link.click();
       document.body.removeChild(link);
-      URL.revokeObjectURL(blobUrl);
       
       toast.success('Download iniciado!');
     } catch (error) {
@@ -762,28 +842,93 @@ function Dashboard() {
     }
   };
 
+  // Several PDFs or a ZIP archive go through /upload-works, titled after each file name
+  const isBulkUpload = uploadFiles.length > 1 || uploadFiles.some((file) => file.name.toLowerCase().endsWith('.zip'));
+
+  const resetUploadForm = () => {
+    setUploadDialog(false);
+    setUploadTitle('');
+    setUploadFiles([]);
+    setUploadLevel('');
+  };
+
+  const handleBulkUpload = async () => {
+    let succeeded = 0;
+    const errors = [];
+    const retryFiles = [];
+    for (let start = 0; start < uploadFiles.length; start += BULK_UPLOAD_BATCH_SIZE) {
+      const batch = uploadFiles.slice(start, start + BULK_UPLOAD_BATCH_SIZE);
+      const formData = new FormData();
+      batch.forEach((file) => formData.append('files', file));
+      try {
+        const response = await axios.post(`${API}/upload-works/${uploadLevel}`, formData, {
+          headers: { 'Content-Type': 'multipart/form-data' }
+        });
+        succeeded += response.data.succeeded;
+        const failed = response.data.results.filter((result) => !result.ok);
+        failed.forEach((result) => errors.push(`${result.name}: ${result.error}`));
+        // Keep failed PDFs selected for another try; entries of a ZIP are named archive/entry and
+        // retrying the archive would upload its good entries twice
+        const failedNames = new Set(failed.map((result) => result.name));
+        retryFiles.push(...batch.filter((file) => failedNames.has(file.name)));
+      } catch (error) {
+        errors.push(error.response?.data?.detail || 'Erro ao enviar trabalhos');
+        retryFiles.push(...batch);
+      }
+    }
+
+    if (succeeded > 0) {
+      toast.success(`${succeeded} trabalhos enviados com sucesso!`);
+    }
+    if (errors.length > 0) {
+      console.error('Bulk upload failures:', errors);
+      toast.error(`${errors.length} falha(s): ${errors.slice(0, 3).join('; ')}${errors.length > 3 ? '…' : ''}`);
+      setUploadFiles(retryFiles);
+    } else {
+      resetUploadForm();
+    }
+    loadWorks();
+    loadUsersWithWorks();
+  };
+
   const handleUpload = async (e) => {
     e.preventDefault();
-    if (!uploadFile || !uploadTitle || !uploadLevel) {
+    if (uploadFiles.length === 0 || !uploadLevel || (!isBulkUpload && !uploadTitle)) {
       toast.error('Preencha todos os campos');
       return;
     }
 
     setLoading(true);
+    if (isBulkUpload) {
+      await handleBulkUpload();
+      setLoading(false);
+      return;
+    }
+
+    const uploadFile = uploadFiles[0];
     const formData = new FormData();
     formData.append('file', uploadFile);
     formData.append('title', uploadTitle);
 
     try {
-      const response = await axios.post(`${API}/upload-work/${uploadLevel}?title=${encodeURIComponent(uploadTitle)}`, formData, {
-        headers: { 'Content-Type': 'multipart/form-data' }
-      });
+      // Skip sending the bytes when the server already stores this PDF
+      const sha256 = await sha256Hex(uploadFile);
+      let uploaded = false;
+      if (sha256) {
+        const preflight = await axios.post(
+          `${API}/upload-work/${uploadLevel}/preflight?title=${encodeURIComponent(uploadTitle)}`,
+          { sha256, filename: uploadFile.name }
+        );
+        uploaded = preflight.data.uploaded;
+      }
+      if (!uploaded) {
+        await axios.post(`${API}/upload-work/${uploadLevel}?title=${encodeURIComponent(uploadTitle)}`, formData, {
+          headers: { 'Content-Type': 'multipart/form-data' }
+        });
+      }
       
       toast.success('Trabalho enviado com sucesso!');
-      setUploadDialog(false);
-      setUploadTitle('');
-      setUploadFile(null);
-      setUploadLevel('');
+      resetUploadForm();
       loadWorks();
       loadUsersWithWorks();
     } catch (error) {
@@ -1065,9 +1210,10 @@ function Dashboard() {
                       id="title"
                       value={uploadTitle}
                       onChange={(e) => setUploadTitle(e.target.value)}
-                      placeholder="Ex: Simbolismo da Acácia"
+                      placeholder={isBulkUpload ? 'Usa o nome de cada arquivo' : 'Ex: Simbolismo da Acácia'}
                       className="border-amber-300 focus:border-amber-500"
-                      required
+                      disabled={isBulkUpload}
+                      required={!isBulkUpload}
                     />
                   </div>
 
@@ -1095,16 +1241,19 @@ function Dashboard() {
                   </div>
 
                   <div className="space-y-2">
-                    <Label htmlFor="file" className="text-amber-900 font-medium">Arquivo PDF</Label>
+                    <Label htmlFor="file" className="text-amber-900 font-medium">Arquivos PDF</Label>
                     <Input
                       id="file"
                       type="file"
-                      accept=".pdf"
-                      onChange={(e) => setUploadFile(e.target.files[0])}
+                      accept=".pdf,.zip"
+                      multiple
+                      onChange={(e) => setUploadFiles(Array.from(e.target.files))}
                       className="border-amber-300 focus:border-amber-500"
                       required
                     />
-                    <p className="text-sm text-amber-600">Apenas arquivos PDF são aceitos</p>
+                    <p className="text-sm text-amber-600">
+                      Um ou vários arquivos PDF, ou um arquivo ZIP com PDFs
+                    </p>
                   </div>
                 </CardContent>
                 <CardFooter>
@@ -1126,10 +1275,23 @@ function Dashboard() {
               <TabsContent value="pending">
                 <Card className="bg-white/80 border-amber-200">
                   <CardHeader>
-                    <CardTitle className="text-amber-900 font-serif">Usuários Pendentes de Aprovação</CardTitle>
-                    <CardDescription className="text-amber-700">
-                      Solicitações de acesso aguardando sua aprovação
-                    </CardDescription>
+                    <div className="flex items-center justify-between">
+                      <div>
+                        <CardTitle className="text-amber-900 font-serif">Usuários Pendentes de Aprovação</CardTitle>
+                        <CardDescription className="text-amber-700">
+                          Solicitações de acesso aguardando sua aprovação
+                        </CardDescription>
+                      </div>
+                      {pendingUsers.length > 1 && (
+                        <Button
+                          size="sm"
+                          className="bg-green-600 hover:bg-green-700"
+                          onClick={approveAllPending}
+                        >
+                          Aprovar todos
+                        </Button>
+                      )}
+                    </div>
                   </CardHeader>
                   <CardContent>
                     {pendingUsers.length === 0 ? (
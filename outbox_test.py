@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from aiosmtpd.controller import Controller
+
+BACKEND_DIR = Path(__file__).parent / "backend"
+
+
+class RecordingHandler:
+    """aiosmtpd handler that keeps every message and the connection it arrived on"""
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append({
+            "peer": session.peer,
+            "to": envelope.rcpt_tos,
+            "content": envelope.content.decode("utf-8", errors="replace"),
+        })
+        return "250 Message accepted for delivery"
+
+
+class OutboxTester:
+    """Drive the email outbox and its SMTP sender against a local aiosmtpd
+    server, using the backend's renderers and a throwaway database."""
+
+    def __init__(self, server, port):
+        self.server = server
+        self.port = port
+        self.tests_run = 0
+        self.tests_passed = 0
+        self.handler = RecordingHandler()
+        self.controller = None
+        self.transport = None
+        self.sender = None
+
+    def log_test(self, name, success, details=""):
+        """Log test results"""
+        self.tests_run += 1
+        if success:
+            self.tests_passed += 1
+            print(f"✅ {name} - PASSED {details}")
+        else:
+            print(f"❌ {name} - FAILED {details}")
+        return success
+
+    def start_smtp(self):
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+        self.controller.start()
+
+    def stop_smtp(self):
+        if self.controller is not None:
+            self.controller.stop()
+            self.controller = None
+
+    async def wait_for(self, predicate, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if await predicate():
+                return True
+            await asyncio.sleep(0.1)
+        return False
+
+    async def statuses(self, ids):
+        docs = await self.server.db.outbox.find({"id": {"$in": ids}}, {"_id": 0}).to_list(None)
+        return {doc["id"]: doc for doc in docs}
+
+    async def all_status(self, ids, status):
+        docs = await self.statuses(ids)
+        return len(docs) == len(ids) and all(doc["status"] == status for doc in docs.values())
+
+    async def add_reset_token(self, email, used=False):
+        nonce = uuid.uuid4().hex
+        await self.server.db.password_reset_tokens.insert_one({
+            "email": email,
+            "nonce": nonce,
+            "token_hash": self.server.hash_reset_token(self.server.derive_reset_token(email, nonce)),
+            "used": used,
+            "expires_at": datetime.now(timezone.utc) + timedelta(hours=1),
+        })
+        return nonce
+
+    async def test_registration_digest(self):
+        print("\n🔍 Testing registration digest...")
+        outbox = self.server.outbox
+        ids = [
+            await outbox.append("registration_digest", {"full_name": f"Irmão {i}", "email": f"irmao{i}@example.com"},
+                                delay_seconds=1)
+            for i in range(5)
+        ]
+        await asyncio.sleep(0.3)
+        self.log_test("Digest held until due", not self.handler.messages, f"{len(self.handler.messages)} sent early")
+
+        sent = await self.wait_for(lambda: self.all_status(ids, "sent"))
+        digests = [m for m in self.handler.messages if "cadastro" in m["content"]]
+        self.log_test("Registrations marked sent", sent)
+        if not self.log_test("One digest for five registrations", len(digests) == 1, f"{len(digests)} emails"):
+            return
+        content = digests[0]["content"]
+        self.log_test("Digest lists every registration",
+                      all(f"irmao{i}@example.com" in content for i in range(5)))
+        self.log_test("Digest goes to the admins",
+                      sorted(digests[0]["to"]) == sorted(self.server.ADMIN_EMAILS), str(digests[0]["to"]))
+
+    async def test_password_resets(self):
+        print("\n🔍 Testing password reset emails...")
+        before = len(self.handler.messages)
+        emails = [f"reset{i}@example.com" for i in range(3)]
+        nonces = [await self.add_reset_token(email) for email in emails]
+        ids = [await self.server.outbox.append("password_reset", {"email": e, "nonce": n})
+               for e, n in zip(emails, nonces)]
+
+        sent = await self.wait_for(lambda: self.all_status(ids, "sent"))
+        new = self.handler.messages[before:]
+        self.log_test("Reset emails sent", sent and len(new) == 3, f"{len(new)} emails")
+        tokens_ok = all(
+            any(m["to"] == [email] and self.server.derive_reset_token(email, nonce) in m["content"] for m in new)
+            for email, nonce in zip(emails, nonces)
+        )
+        self.log_test("Each email carries its own token", tokens_ok)
+
+        used_nonce = await self.add_reset_token("used@example.com", used=True)
+        used_id = await self.server.outbox.append("password_reset", {"email": "used@example.com", "nonce": used_nonce})
+        skipped = await self.wait_for(lambda: self.all_status([used_id], "skipped"))
+        self.log_test("Used token is not emailed", skipped and not any(
+            m["to"] == ["used@example.com"] for m in self.handler.messages))
+
+    async def test_connection_reuse(self):
+        print("\n🔍 Testing SMTP connection reuse...")
+        peers = {m["peer"] for m in self.handler.messages}
+        self.log_test("All emails over one connection",
+                      len(peers) == 1 and self.transport.connections_opened == 1,
+                      f"{len(self.handler.messages)} emails, {self.transport.connections_opened} connections")
+
+    async def test_backoff_respected(self):
+        print("\n🔍 Testing that waiting messages are not swept up...")
+        waiting_nonce = await self.add_reset_token("waiting@example.com")
+        waiting_id = await self.server.outbox.append(
+            "password_reset", {"email": "waiting@example.com", "nonce": waiting_nonce}, delay_seconds=60)
+        due_nonce = await self.add_reset_token("due@example.com")
+        due_id = await self.server.outbox.append("password_reset", {"email": "due@example.com", "nonce": due_nonce})
+
+        sent = await self.wait_for(lambda: self.all_status([due_id], "sent"))
+        waiting = (await self.statuses([waiting_id]))[waiting_id]
+        self.log_test("Due reset sent", sent)
+        self.log_test("Reset still in backoff left queued",
+                      waiting["status"] == "pending" and waiting["attempts"] == 0, waiting["status"])
+        # Out of the way of the outage test
+        await self.server.db.outbox.delete_one({"id": waiting_id})
+
+    async def test_retry_after_outage(self):
+        print("\n🔍 Testing retry after an SMTP outage...")
+        self.stop_smtp()
+        nonce = await self.add_reset_token("outage@example.com")
+        message_id = await self.server.outbox.append("password_reset", {"email": "outage@example.com", "nonce": nonce})
+
+        async def failed_once():
+            doc = (await self.statuses([message_id])).get(message_id)
+            return doc is not None and doc["status"] == "pending" and doc["attempts"] == 1 and doc["last_error"]
+
+        if not self.log_test("Failed send is queued again", await self.wait_for(failed_once)):
+            return
+        self.start_smtp()
+        # Skip the backoff instead of waiting it out
+        await self.server.db.outbox.update_one({"id": message_id},
+                                               {"$set": {"send_after": datetime.now(timezone.utc)}})
+        self.server.outbox.wakeup.set()
+        sent = await self.wait_for(lambda: self.all_status([message_id], "sent"))
+        self.log_test("Sent after the server is back", sent and any(
+            m["to"] == ["outage@example.com"] for m in self.handler.messages),
+            f"{self.transport.connections_opened} connections")
+
+    async def run_all_tests(self):
+        from outbox import OutboxSender, SmtpTransport
+
+        print("📧 Starting Outbox Tests")
+        print("=" * 70)
+        self.start_smtp()
+        self.transport = SmtpTransport("127.0.0.1", self.port, starttls=False, timeout=2)
+        self.sender = OutboxSender(self.server.outbox, self.transport, self.server.OUTBOX_RENDERERS,
+                                   poll_interval=0.2)
+        await self.sender.start()
+        try:
+            await self.test_registration_digest()
+            await self.test_password_resets()
+            await self.test_connection_reuse()
+            await self.test_backoff_respected()
+            await self.test_retry_after_outage()
+        finally:
+            await self.sender.stop()
+            self.stop_smtp()
+
+        print("\n" + "=" * 70)
+        print(f"📊 OUTBOX TEST RESULTS: {self.tests_passed}/{self.tests_run} tests passed")
+        return 0 if self.tests_passed == self.tests_run else 1
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(args):
+    import server
+
+    try:
+        return await OutboxTester(server, args.port or free_port()).run_all_tests()
+    finally:
+        await server.client.drop_database(server.db.name)
+        server.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify batched outbox email delivery against a local SMTP server")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--port", type=int, help="port for the local SMTP server (default: any free port)")
+    args = parser.parse_args()
+    # aiosmtpd logs every SMTP command at INFO
+    logging.getLogger("mail.log").setLevel(logging.WARNING)
+    # A throwaway database, dropped afterwards
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = f"outbox_test_{uuid.uuid4().hex[:8]}"
+    sys.path.insert(0, str(BACKEND_DIR))
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())